@@ -0,0 +1,161 @@
+import json
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from command_scheduler import PRIORITY_COMMANDS
+
+# 总是记录的命令：连接状态变化和优先命令
+ALWAYS_RECORD = PRIORITY_COMMANDS | {'connect', 'disconnect'}
+# 按住移动的按下/松开每次操作只有一对，总是记录；心跳和重复的单次命令抽样
+ALWAYS_RECORD_EVENTS = {'press', 'release'}
+
+
+class _AuditQueueHandler(QueueHandler):
+    """请求线程只把记录放入有界队列；不做格式化，队列满时丢弃并计数"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _RingHandler(logging.Handler):
+    """在内存中保留最近的审计记录"""
+
+    def __init__(self, capacity):
+        super().__init__()
+        self.entries = deque(maxlen=capacity)
+        self.entries_lock = threading.Lock()
+
+    def emit(self, record):
+        with self.entries_lock:
+            self.entries.append(record.audit)
+
+    def recent(self, limit=None):
+        with self.entries_lock:
+            entries = list(self.entries)
+        return entries[-limit:] if limit else entries
+
+
+class _JsonLineFormatter(logging.Formatter):
+    def format(self, record):
+        return json.dumps(record.audit, separators=(',', ':'), ensure_ascii=False)
+
+
+class AuditLog:
+    """命令审计日志
+
+    请求路径上只构造一个小字典并放入队列，写文件和维护内存环形缓冲都在后台线程中完成。
+    停止、连接类命令、按下/松开和所有失败总是记录；其余重复命令（按住时的心跳、
+    连续点击的同一命令）每个客户端每 sample_every 条记录一条，记录中的 skipped 为期间省略的条数。
+    文件超过 max_bytes 时轮转，最多保留 backup_count 个旧文件；max_bytes 为0表示不轮转。
+    """
+
+    def __init__(self, path=None, sample_every=10, capacity=500, max_queue=10000, max_bytes=10 * 1024 * 1024,
+                 backup_count=5):
+        self.sample_every = max(1, int(sample_every))
+        self._counts = {}  # (机器人, 客户端, 命令, 事件) -> 自上次记录以来省略的条数
+        self._counts_lock = threading.Lock()
+        self.recorded = 0
+        self.sampled_out = 0
+
+        self._ring = _RingHandler(capacity)
+        handlers = [self._ring]
+        if path:
+            file_handler = RotatingFileHandler(path, mode='a', maxBytes=max_bytes, backupCount=backup_count,
+                                               encoding='utf-8', delay=True)
+            file_handler.setFormatter(_JsonLineFormatter())
+            handlers.append(file_handler)
+        self._handlers = handlers
+
+        self._queue_handler = _AuditQueueHandler(queue.Queue(max_queue))
+        self._listener = QueueListener(self._queue_handler.queue, *handlers)
+        self.logger = logging.getLogger(f'robot.audit.{id(self):x}')
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        self.logger.addHandler(self._queue_handler)
+        self._started = False
+
+    @property
+    def dropped(self):
+        return self._queue_handler.dropped
+
+    def start(self):
+        if not self._started:
+            self._started = True
+            self._listener.start()
+
+    def stop(self):
+        """写完队列中剩余的记录后停止后台线程"""
+        if self._started:
+            self._started = False
+            self._listener.stop()
+            for handler in self._handlers:
+                handler.close()
+
+    def _should_record(self, key, command, event, result):
+        """返回 (是否记录, 此前省略的条数)"""
+        if result != 'ok' or command in ALWAYS_RECORD or event in ALWAYS_RECORD_EVENTS:
+            with self._counts_lock:
+                skipped = self._counts.pop(key, 0)
+            return True, skipped
+        with self._counts_lock:
+            skipped = self._counts.get(key)
+            if skipped is None or skipped + 1 >= self.sample_every:
+                self._counts[key] = 0
+                return True, skipped or 0
+            self._counts[key] = skipped + 1
+            if len(self._counts) > 4096:
+                # 客户端标识每次打开页面都会变化，防止计数表无限增长
+                self._counts.clear()
+            return False, 0
+
+    def record(self, command, event=None, client=None, channel=None, latency=None, result='ok', message=None,
+               robot=None):
+        """记录一条命令处理结果；latency 单位为秒"""
+        command = str(command) if command is not None else None
+        record, skipped = self._should_record((robot, client, command, event), command, event, result)
+        if not record:
+            self.sampled_out += 1
+            return
+        self.recorded += 1
+        entry = {
+            'time': round(time.time(), 3),
+            'robot': robot,
+            'client': client,
+            'channel': channel,
+            'command': command,
+            'event': event,
+            'latency_ms': round(latency * 1000, 3) if latency is not None else None,
+            'result': result,
+        }
+        if message:
+            entry['message'] = message
+        if skipped:
+            entry['skipped'] = skipped
+        self.logger.info('audit', extra={'audit': entry})
+
+    def recent(self, limit=None):
+        """最近的审计记录，从旧到新"""
+        return self._ring.recent(limit)
+
+    def stats(self):
+        return {
+            'recorded': self.recorded,
+            'sampled_out': self.sampled_out,
+            'dropped': self.dropped,
+            'sample_every': self.sample_every,
+            'buffered': len(self._ring.entries),
+        }
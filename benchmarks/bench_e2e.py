@@ -0,0 +1,177 @@
+"""端到端基准：模拟器（摄像头 + 机器人控制端口）+ serve.py 子进程 + N 个观看者 + M 个命令客户端
+
+报告每个观看者的帧率、服务进程每路视频流的CPU、内存增长、画面从摄像头发出到观看者收到的延迟，
+以及按下到机器人收到命令的延迟分位数。
+命令客户端以固定频率发送单次运动命令制造负载；探测客户端反复按下/松开一个负载中不使用的命令，
+由模拟机器人记录该命令的到达时间，因此延迟只统计探测命令。
+
+用法: python benchmarks/bench_e2e.py [--viewers 20 --command-clients 4 --probes 200 --p99-bound-ms 50]
+超过 --p99-bound-ms 或观看者中位帧率低于源帧率的 90% 时以非零状态退出，可用于回归检查。
+"""
+import argparse
+import http.client
+import json
+import random
+import statistics
+import sys
+import threading
+import time
+
+from common import StreamClients, percentile, process_usage, start_server, stop_server
+from simulator import CommandSink, SimulatedCamera, parse_size
+
+LOAD_MOTIONS = ['forward', 'backward', 'left', 'right', 'turn_right']
+PROBE_COMMAND = 'turn_left'
+
+
+class CommandClient:
+    """一个保持连接的 HTTP 命令客户端"""
+
+    def __init__(self, port, client_id):
+        self.conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+        self.client_id = client_id
+        self.ok = 0
+        self.failed = 0
+
+    def send(self, command, event=None):
+        body = json.dumps({'command': command, 'event': event, 'client_id': self.client_id})
+        try:
+            self.conn.request('POST', '/api/command', body, {'Content-Type': 'application/json'})
+            result = json.loads(self.conn.getresponse().read())
+        except (OSError, http.client.HTTPException, ValueError):
+            self.conn.close()
+            self.failed += 1
+            return False
+        success = result.get('status') == 'success'
+        if success:
+            self.ok += 1
+        else:
+            self.failed += 1
+        return success
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--worker', choices=('gevent', 'threaded'), default='gevent')
+    parser.add_argument('--viewers', type=int, default=20)
+    parser.add_argument('--command-clients', type=int, default=4)
+    parser.add_argument('--command-rate', type=float, default=10, help='commands per second per client')
+    parser.add_argument('--probes', type=int, default=200, help='measured press-to-robot samples')
+    parser.add_argument('--size', type=parse_size, default=(640, 480), help='camera WIDTHxHEIGHT')
+    parser.add_argument('--fps', type=float, default=15)
+    parser.add_argument('--jpeg-kb', type=int, default=0)
+    parser.add_argument('--warmup', type=float, default=3, help='seconds before measuring')
+    parser.add_argument('--p99-bound-ms', type=float, default=None)
+    args = parser.parse_args()
+
+    camera = SimulatedCamera(size=args.size, fps=args.fps, jpeg_size=args.jpeg_kb * 1024).start()
+    sink = CommandSink().start()
+    try:
+        proc, port = start_server(sink.port, camera.port, args.worker)
+    except RuntimeError as e:
+        camera.close()
+        sink.close()
+        print(e)
+        return 1
+
+    done = threading.Event()
+    try:
+        probe = CommandClient(port, 'probe')
+        if not probe.send('connect'):
+            print("server could not connect to the simulated robot")
+            return 1
+
+        clients = StreamClients(port, track_latency=True)
+        streams = clients.open('/video_feed', args.viewers)
+
+        def watch():
+            while not done.is_set():
+                clients.run(0.5)
+
+        viewer_thread = threading.Thread(target=watch, daemon=True)
+        viewer_thread.start()
+
+        def load(client):
+            period = 1.0 / args.command_rate
+            next_send = time.monotonic()
+            while not done.is_set():
+                client.send(random.choice(LOAD_MOTIONS))
+                next_send += period
+                time.sleep(max(0.0, next_send - time.monotonic()))
+
+        loaders = [CommandClient(port, f'load-{i}') for i in range(args.command_clients)]
+        for client in loaders:
+            threading.Thread(target=load, args=(client,), daemon=True).start()
+
+        time.sleep(args.warmup)
+        for stream in streams:
+            stream.frames, stream.first_frame = 0, None  # 只统计预热之后
+            stream.latencies = []
+        cpu_start, rss_start = process_usage(proc.pid)
+        started = time.monotonic()
+        sink_start = sink.total
+
+        latencies, lost = [], 0
+        for _ in range(args.probes):
+            time.sleep(random.uniform(0.05, 0.15))
+            sent_at = time.time()
+            probe.send(PROBE_COMMAND, 'press')
+            arrived = sink.wait_for(PROBE_COMMAND, sent_at)
+            if arrived is None:
+                lost += 1
+            else:
+                latencies.append((arrived - sent_at) * 1000)
+            probe.send(PROBE_COMMAND, 'release')
+
+        elapsed = time.monotonic() - started
+        cpu_end, rss_end = process_usage(proc.pid)
+        done.set()
+        viewer_thread.join(timeout=2)
+        end = time.monotonic()  # 观看线程在本轮读取结束前还会继续计帧
+        rates = sorted(stream.fps(end) for stream in streams)
+        video_latencies = sorted(value * 1000 for stream in streams for value in stream.latencies)
+        clients.close()
+    finally:
+        done.set()
+        stop_server(proc)
+        camera.close()
+        sink.close()
+
+    print(f"worker={args.worker} camera={args.size[0]}x{args.size[1]}@{args.fps:g}fps "
+          f"viewers={args.viewers} command_clients={args.command_clients}x{args.command_rate:g}/s "
+          f"measured={elapsed:.1f}s")
+    if rates:
+        print(f"video fps/viewer: min={rates[0]:.1f} p10={percentile(rates, 0.1):.1f} "
+              f"median={statistics.median(rates):.1f} (source {args.fps:g})")
+    if video_latencies:
+        print(f"camera-to-viewer ms: p50={statistics.median(video_latencies):.2f} "
+              f"p90={percentile(video_latencies, 0.9):.2f} p99={percentile(video_latencies, 0.99):.2f} "
+              f"samples={len(video_latencies)}")
+    if cpu_start is not None and cpu_end is not None:
+        cpu = (cpu_end - cpu_start) / elapsed
+        per_stream = cpu / args.viewers if args.viewers else 0
+        print(f"server cpu: {cpu * 100:.0f}% total, {per_stream * 100:.2f}% per stream; "
+              f"rss {rss_start:.0f}MB -> {rss_end:.0f}MB ({rss_end - rss_start:+.1f}MB)")
+    ok = sum(client.ok for client in loaders)
+    failed = sum(client.failed for client in loaders)
+    print(f"load commands: ok={ok} rejected/failed={failed}; robot received {sink.total - sink_start} lines")
+    if not latencies:
+        print(f"press-to-robot: no samples (lost {lost})")
+        return 1
+    latencies.sort()
+    p99 = percentile(latencies, 0.99)
+    print(f"press-to-robot ms: p50={statistics.median(latencies):.2f} p90={percentile(latencies, 0.9):.2f} "
+          f"p99={p99:.2f} max={latencies[-1]:.2f} lost={lost}")
+
+    failed_checks = []
+    if args.p99_bound_ms is not None and (p99 > args.p99_bound_ms or lost):
+        failed_checks.append(f"p99 {p99:.2f}ms > {args.p99_bound_ms}ms or lost probes")
+    if rates and statistics.median(rates) < args.fps * 0.9:
+        failed_checks.append("median viewer fps below 90% of source")
+    for check in failed_checks:
+        print(f"FAIL: {check}")
+    return 1 if failed_checks else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,72 @@
+"""MJPEG解析吞吐量：增量解析器 vs 旧的 bytes 拼接+全量查找，合成1080p流
+
+用法: python benchmarks/bench_mjpeg_parser.py [--frames 60 --chunk-sizes 1024,65536]
+"""
+import argparse
+
+from common import synthetic_jpeg, measure
+from mjpeg import MJPEGParser
+
+
+def build_stream(jpgs, content_length):
+    """把JPEG帧拼成 multipart 流，可选带 Content-Length 头"""
+    parts = []
+    for jpg in jpgs:
+        header = b'--frame\r\nContent-Type: image/jpeg\r\n'
+        if content_length:
+            header += b'Content-Length: ' + str(len(jpg)).encode('ascii') + b'\r\n'
+        parts.append(header + b'\r\n' + jpg + b'\r\n')
+    return b''.join(parts)
+
+
+def legacy_parse(stream, chunk_size):
+    """原实现：每个数据块都拼接 bytes 并从头查找 SOI/EOI"""
+    bytes_data = b""
+    frames = 0
+    for i in range(0, len(stream), chunk_size):
+        bytes_data += stream[i:i + chunk_size]
+        a = bytes_data.find(b'\xff\xd8')
+        b = bytes_data.find(b'\xff\xd9')
+        if a != -1 and b != -1:
+            bytes_data = bytes_data[b+2:]
+            frames += 1
+    return frames
+
+
+def incremental_parse(stream, chunk_size):
+    parser = MJPEGParser()
+    view = memoryview(stream)
+    for i in range(0, len(stream), chunk_size):
+        parser.feed(view[i:i + chunk_size])
+    return parser.frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--frames', type=int, default=60)
+    parser.add_argument('--chunk-sizes', default='1024,16384,65536')
+    parser.add_argument('--skip-legacy', action='store_true', help='跳过旧实现（小数据块时非常慢）')
+    args = parser.parse_args()
+
+    jpgs = [synthetic_jpeg(args.width, args.height, seed % 8) for seed in range(args.frames)]
+    print(f"{args.frames} frames {args.width}x{args.height}, avg jpeg {sum(map(len, jpgs)) // len(jpgs)} bytes")
+
+    for content_length in (False, True):
+        stream = build_stream(jpgs, content_length)
+        mb = len(stream) / 1e6
+        for chunk_size in (int(c) for c in args.chunk_sizes.split(',')):
+            runs = [('incremental', incremental_parse)]
+            if not args.skip_legacy:
+                runs.append(('legacy', legacy_parse))
+            for name, fn in runs:
+                result = {}
+                wall, cpu = measure(lambda _: result.setdefault('frames', fn(stream, chunk_size)), 1)
+                label = f"{name} chunk={chunk_size} content-length={'yes' if content_length else 'no'}"
+                print(f"{label:<48} frames={result['frames']:<5} {mb / wall:8.1f} MB/s  "
+                      f"{result['frames'] / wall:8.1f} fps  cpu={cpu:.3f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+"""对比 /video_feed 的JPEG直通与解码重编码两种模式的每核帧率
+
+用法: python benchmarks/bench_passthrough.py [--width 1280 --height 720 --frames 300]
+"""
+import argparse
+
+from common import synthetic_jpeg, measure, report
+from frame_codec import transform_jpeg
+from mjpeg import multipart_chunk
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--quality', type=int, default=80, help='重编码模式使用的JPEG质量')
+    args = parser.parse_args()
+
+    # 预先生成少量不同的帧循环使用，避免把合成耗时算进结果
+    jpgs = [synthetic_jpeg(args.width, args.height, seed) for seed in range(8)]
+    print(f"source {args.width}x{args.height}, avg jpeg {sum(map(len, jpgs)) // len(jpgs)} bytes")
+
+    wall, cpu = measure(lambda i: multipart_chunk(jpgs[i % len(jpgs)]), args.frames)
+    report('passthrough', args.frames, wall, cpu)
+
+    wall, cpu = measure(lambda i: multipart_chunk(transform_jpeg(jpgs[i % len(jpgs)], quality=args.quality)),
+                        args.frames)
+    report('decode+re-encode', args.frames, wall, cpu)
+
+    wall, cpu = measure(lambda i: multipart_chunk(transform_jpeg(jpgs[i % len(jpgs)], width=640, quality=args.quality)),
+                        args.frames)
+    report('decode+resize(640)+encode', args.frames, wall, cpu)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""缩小解码收益：全尺寸解码+缩放 vs 按目标尺寸选择 IMREAD_REDUCED_COLOR_2/4/8 后再缩放，单位 ms/帧
+
+用法: python benchmarks/bench_reduced_decode.py [--width 1920 --height 1080 --frames 100]
+"""
+import argparse
+
+import cv2
+
+from common import synthetic_jpeg, measure
+from frame_codec import DecodeScalePolicy, decode_jpeg
+
+
+def fit(frame, target):
+    """与客户端相同：保持宽高比缩放到目标尺寸内"""
+    src_h, src_w = frame.shape[:2]
+    scale = min(target[0] / src_w, target[1] / src_h)
+    size = (max(1, int(src_w * scale)), max(1, int(src_h * scale)))
+    return cv2.resize(frame, size, interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--targets', default='1280x720,960x540,640x480,480x270,320x240')
+    args = parser.parse_args()
+
+    jpgs = [synthetic_jpeg(args.width, args.height, seed) for seed in range(8)]
+    print(f"source {args.width}x{args.height}, avg jpeg {sum(map(len, jpgs)) // len(jpgs)} bytes")
+
+    for target in args.targets.split(','):
+        target = tuple(int(v) for v in target.split('x'))
+        _, full_cpu = measure(lambda i: fit(decode_jpeg(jpgs[i % len(jpgs)]), target), args.frames)
+
+        policy = DecodeScalePolicy(target)
+        _, reduced_cpu = measure(lambda i: fit(policy.decode(jpgs[i % len(jpgs)]), target), args.frames)
+
+        full_ms = full_cpu * 1000 / args.frames
+        reduced_ms = reduced_cpu * 1000 / args.frames
+        print(f"target {target[0]}x{target[1]:<5} full={full_ms:7.2f} ms/frame  "
+              f"reduced(1/{policy.factor})={reduced_ms:7.2f} ms/frame  saved={full_ms - reduced_ms:6.2f} ms "
+              f"({(1 - reduced_ms / full_ms) * 100 if full_ms else 0:4.1f}%)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+"""启动时间基准：两个入口的导入耗时，以及从启动进程到看到第一帧画面的时间
+
+1. 分别在全新的子进程中导入 server 和 integrated_controller，取 --runs 次的中位数，
+   并检查导入之后 OpenCV、NumPy、requests 仍未加载（它们只应在视频路径第一次用到时加载）。
+2. 本地模拟器 + serve.py 子进程：启动 -> 端口开始监听 -> /video_feed 收到第一帧。
+3. Qt 客户端（offscreen 平台）子进程：启动 -> 窗口显示 -> 连上机器人控制端口 -> 绘制第一帧。
+
+用法: python benchmarks/bench_startup.py [--runs 5 --import-bound-ms 500 --first-frame-bound-ms 3000]
+导入时加载了重依赖，或超过给定上限时以非零状态退出，可用于回归检查。
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+from common import ROOT, start_server, stop_server
+from simulator import CommandSink, SimulatedCamera
+
+# 入口模块导入时不应加载的依赖
+HEAVY_MODULES = ('cv2', 'numpy', 'requests')
+
+IMPORT_PROBE = '''
+import json, sys, time
+started = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - started
+print(json.dumps({{'seconds': seconds, 'loaded': [m for m in {heavy!r} if m in sys.modules]}}))
+'''
+
+
+def measure_import(module, runs):
+    """在全新解释器中导入 module，返回 (各次耗时列表, 导入后已加载的重依赖)"""
+    env = dict(os.environ, QT_QPA_PLATFORM='offscreen')
+    times, loaded = [], set()
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', IMPORT_PROBE.format(module=module, heavy=HEAVY_MODULES)],
+                                cwd=ROOT, env=env, capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        times.append(result['seconds'])
+        loaded.update(result['loaded'])
+    return times, sorted(loaded)
+
+
+def server_first_frame(camera, sink, worker, timeout):
+    """启动 serve.py，返回 (监听秒数, 第一帧秒数)，均从启动子进程算起"""
+    spawned = time.monotonic()
+    proc, port = start_server(sink.port, camera.port, worker, wait=False)
+    try:
+        deadline = spawned + timeout
+        while True:
+            try:
+                sock = socket.create_connection(('127.0.0.1', port), timeout=timeout)
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError("server did not start")
+                time.sleep(0.005)
+        listening = time.monotonic() - spawned
+        with sock:
+            sock.sendall(b'GET /video_feed HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n')
+            data = b''
+            # 响应头之后第一个完整JPEG（以 EOI 结束）即为第一帧
+            while b'\xff\xd9' not in data.partition(b'\xff\xd8')[2]:
+                chunk = sock.recv(1 << 16)
+                if not chunk:
+                    raise RuntimeError("video feed closed before the first frame")
+                data += chunk
+        return listening, time.monotonic() - spawned
+    finally:
+        stop_server(proc)
+
+
+def qt_child(spawned, timeout):
+    """在子进程中运行：显示客户端窗口，按 main() 的顺序启动，报告各事件相对启动时刻的秒数"""
+    from PyQt5.QtCore import QTimer
+    from PyQt5.QtWidgets import QApplication
+    from integrated_controller import RobotControlUI
+
+    app = QApplication(sys.argv)
+    events = {}
+
+    def mark(name):
+        events.setdefault(name, time.monotonic() - spawned)
+        if len(events) == 3:
+            app.quit()
+
+    window = RobotControlUI('127.0.0.1', int(os.environ['ROBOT_PORT']), int(os.environ['ROBOT_VIDEO_PORT']))
+    window.socket.connected.connect(lambda: mark('connected'))
+    # 绘制槽先连接，这里在它之后执行，此时第一帧已经绘制完成
+    window.stream_thread.frame_ready.connect(lambda: mark('first_frame'))
+    window.show()
+    QTimer.singleShot(0, window.start)
+    QTimer.singleShot(0, lambda: mark('shown'))
+    QTimer.singleShot(int(timeout * 1000), app.quit)
+    app.exec_()
+    window.close()
+    print(json.dumps(events))
+
+
+def client_first_frame(camera, sink, timeout):
+    """启动 Qt 客户端子进程，返回 {'shown', 'connected', 'first_frame': 秒数}"""
+    env = dict(os.environ, QT_QPA_PLATFORM='offscreen', ROBOT_PORT=str(sink.port),
+               ROBOT_VIDEO_PORT=str(camera.port))
+    spawned = time.monotonic()  # CLOCK_MONOTONIC 在同一台机器的进程之间可以比较
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--qt-child', repr(spawned),
+                             '--timeout', str(timeout)],
+                            cwd=ROOT, env=env, capture_output=True, text=True, timeout=timeout + 10).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='fresh interpreters per import measurement')
+    parser.add_argument('--worker', choices=('gevent', 'threaded'), default='gevent')
+    parser.add_argument('--timeout', type=float, default=15)
+    parser.add_argument('--import-bound-ms', type=float, default=None)
+    parser.add_argument('--first-frame-bound-ms', type=float, default=None)
+    parser.add_argument('--skip-client', action='store_true', help='skip the Qt client (no PyQt5 installed)')
+    parser.add_argument('--qt-child', type=float, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.qt_child is not None:
+        qt_child(args.qt_child, args.timeout)
+        return 0
+
+    failed_checks = []
+    modules = ['server'] + ([] if args.skip_client else ['integrated_controller'])
+    for module in modules:
+        times, loaded = measure_import(module, args.runs)
+        median = statistics.median(times) * 1000
+        print(f"import {module:<22} median={median:7.1f}ms min={min(times) * 1000:7.1f}ms "
+              f"runs={args.runs} heavy loaded: {', '.join(loaded) or 'none'}")
+        if loaded:
+            failed_checks.append(f"{module} imports {', '.join(loaded)} at startup")
+        if args.import_bound_ms is not None and median > args.import_bound_ms:
+            failed_checks.append(f"{module} import {median:.1f}ms > {args.import_bound_ms}ms")
+
+    camera = SimulatedCamera().start()
+    sink = CommandSink().start()
+    try:
+        listening, first_frame = server_first_frame(camera, sink, args.worker, args.timeout)
+        print(f"server ({args.worker}): listening {listening * 1000:.0f}ms, "
+              f"first /video_feed frame {first_frame * 1000:.0f}ms after spawn")
+        first_frames = [('server', first_frame)]
+        if not args.skip_client:
+            events = client_first_frame(camera, sink, args.timeout)
+            print("qt client: " + ", ".join(f"{name} {events[name] * 1000:.0f}ms"
+                                            for name in ('shown', 'connected', 'first_frame') if name in events)
+                  + " after spawn")
+            if 'first_frame' not in events:
+                failed_checks.append("qt client showed no frame")
+            else:
+                first_frames.append(('qt client', events['first_frame']))
+    finally:
+        camera.close()
+        sink.close()
+
+    if args.first_frame_bound_ms is not None:
+        for name, seconds in first_frames:
+            if seconds * 1000 > args.first_frame_bound_ms:
+                failed_checks.append(f"{name} first frame {seconds * 1000:.0f}ms > {args.first_frame_bound_ms}ms")
+    for check in failed_checks:
+        print(f"FAIL: {check}")
+    return 1 if failed_checks else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
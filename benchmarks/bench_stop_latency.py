@@ -0,0 +1,104 @@
+"""停止命令延迟：本地模拟机器人socket + 大量运动命令压力下，测量 stop 从提交到对端收到的时间
+
+用法: python benchmarks/bench_stop_latency.py [--senders 4 --stops 50 --bound-ms 20]
+超过 --bound-ms 时以非零状态退出，可用于回归检查。
+"""
+import argparse
+import random
+import socket
+import statistics
+import sys
+import threading
+import time
+
+from common import percentile
+from command_scheduler import CommandScheduler
+from robot_link import RobotLink
+
+MOTIONS = ['forward', 'backward', 'left', 'right', 'turn_left', 'turn_right']
+
+
+class StandInRobot:
+    """本地模拟机器人：逐行读取命令并记录 stop 的到达时间，可以模拟读取缓慢的对端"""
+
+    def __init__(self, read_delay):
+        self.read_delay = read_delay
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(1)
+        self.port = self.server.getsockname()[1]
+        self.lines = 0
+        self.stop_arrivals = []
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        conn, _ = self.server.accept()
+        conn.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        pending = b''
+        while True:
+            data = conn.recv(1024)
+            if not data:
+                return
+            now = time.monotonic()
+            pending += data
+            *lines, pending = pending.split(b'\n')
+            self.lines += len(lines)
+            self.stop_arrivals.extend(now for line in lines if line == b'stop')
+            if self.read_delay:
+                time.sleep(self.read_delay)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--senders', type=int, default=4, help='并发发送运动命令的线程数')
+    parser.add_argument('--stops', type=int, default=50, help='测量的 stop 次数')
+    parser.add_argument('--read-delay-ms', type=float, default=0.5, help='模拟机器人每次读取后的停顿')
+    parser.add_argument('--no-rate-limit', action='store_true', help='关闭限速，制造最大积压')
+    parser.add_argument('--bound-ms', type=float, default=20.0)
+    args = parser.parse_args()
+
+    robot = StandInRobot(args.read_delay_ms / 1000)
+    scheduler = CommandScheduler(rate_limits={} if args.no_rate_limit else None)
+    link = RobotLink('127.0.0.1', robot.port, scheduler=scheduler)
+    if not link.connect(wait=2):
+        sys.exit("stand-in robot unreachable")
+
+    running = True
+
+    def flood():
+        while running:
+            link.send(random.choice(MOTIONS))
+            time.sleep(0.0005)
+
+    senders = [threading.Thread(target=flood, daemon=True) for _ in range(args.senders)]
+    for thread in senders:
+        thread.start()
+
+    latencies = []
+    for _ in range(args.stops):
+        time.sleep(random.uniform(0.01, 0.03))
+        arrived = len(robot.stop_arrivals)
+        sent_at = time.monotonic()
+        link.send('stop')
+        deadline = sent_at + 2
+        while len(robot.stop_arrivals) == arrived and time.monotonic() < deadline:
+            time.sleep(0.0001)
+        if len(robot.stop_arrivals) == arrived:
+            latencies.append(float('inf'))
+        else:
+            latencies.append((robot.stop_arrivals[arrived] - sent_at) * 1000)
+
+    running = False
+    link.disconnect()
+
+    latencies.sort()
+    print(f"robot received {robot.lines} lines, link stats {link.stats()}")
+    print(f"stop latency ms: p50={statistics.median(latencies):.2f} p95={percentile(latencies, 0.95):.2f} "
+          f"p99={percentile(latencies, 0.99):.2f} max={latencies[-1]:.2f} (bound {args.bound_ms} ms)")
+    if latencies[-1] > args.bound_ms:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
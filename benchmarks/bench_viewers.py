@@ -0,0 +1,80 @@
+"""并发观看负载测试：simulator.py 的模拟摄像头 + serve.py 子进程，逐级增加 /video_feed 客户端数量
+
+每一级测量每个客户端实际收到的帧率和服务进程的CPU与内存占用；
+第10百分位客户端的帧率不低于源帧率的 90% 视为该级别可以承受。
+
+用法: python benchmarks/bench_viewers.py [--worker gevent --viewers 50,100,200,400 --fps 15 --duration 10 --warmup 2]
+"""
+import argparse
+import statistics
+import sys
+import time
+
+from common import StreamClients, free_port, process_usage, start_server, stop_server
+from simulator import SimulatedCamera, parse_size
+
+
+def run_level(port, pid, viewers, status_clients, duration, warmup):
+    """打开一批客户端并读取 duration 秒，返回每个视频客户端的帧率和服务进程占用
+
+    先读取 warmup 秒再开始计数：打开大量连接期间先连上的客户端积压在socket里的帧不计入帧率。
+    """
+    clients = StreamClients(port)
+    streams = clients.open('/video_feed', viewers)
+    clients.open('/api/status/stream', status_clients)
+    clients.run(warmup)
+    for stream in streams:
+        stream.frames, stream.first_frame = 0, None
+    cpu_start, _ = process_usage(pid)
+    end = clients.run(duration)
+    cpu_end, rss = process_usage(pid)
+    rates = [stream.fps(end) for stream in streams]
+    clients.close()
+    cpu = (cpu_end - cpu_start) / duration if cpu_start is not None and cpu_end is not None else None
+    return rates, cpu, rss
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--worker', choices=('gevent', 'threaded'), default='gevent')
+    parser.add_argument('--viewers', default='50,100,200,400')
+    parser.add_argument('--status-clients', type=float, default=0.1,
+                        help='SSE status streams opened alongside, as a fraction of viewers')
+    parser.add_argument('--size', type=parse_size, default=(640, 480), help='camera WIDTHxHEIGHT')
+    parser.add_argument('--fps', type=float, default=15)
+    parser.add_argument('--frame-kb', type=int, default=60, help='pad each frame to this size')
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--warmup', type=float, default=2, help='seconds read before counting at each level')
+    args = parser.parse_args()
+
+    camera = SimulatedCamera(size=args.size, fps=args.fps, jpeg_size=args.frame_kb * 1024).start()
+    try:
+        proc, port = start_server(free_port(), camera.port, args.worker)
+    except RuntimeError as e:
+        camera.close()
+        print(e)
+        return 1
+    try:
+        print(f"worker={args.worker} source={args.fps:g}fps frame={args.frame_kb}KB duration={args.duration:g}s")
+        sustained = 0
+        for viewers in (int(v) for v in args.viewers.split(',')):
+            rates, cpu, rss = run_level(port, proc.pid, viewers, int(viewers * args.status_clients), args.duration,
+                                      args.warmup)
+            rates.sort()
+            p10 = rates[len(rates) // 10]
+            ok = p10 >= args.fps * 0.9
+            sustained = viewers if ok else sustained
+            cpu_text = f"{cpu * 100:5.0f}%" if cpu is not None else '  n/a'
+            rss_text = f"{rss:6.0f}MB" if rss is not None else '   n/a'
+            print(f"viewers={viewers:<5} fps min={rates[0]:5.1f} p10={p10:5.1f} median={statistics.median(rates):5.1f}"
+                  f"  cpu={cpu_text} rss={rss_text}  {'ok' if ok else 'DEGRADED'}")
+            time.sleep(1)
+        print(f"sustained viewers: {sustained}")
+        return 0
+    finally:
+        stop_server(proc)
+        camera.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,213 @@
+"""基准测试公共工具：合成测试帧、计时与结果输出、启动服务子进程、批量读取长连接"""
+import os
+import re
+import selectors
+import socket
+import subprocess
+import sys
+import time
+
+# 让基准脚本可以直接 import 仓库根目录下的模块
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def synthetic_frame(width, height, seed=0):
+    """生成带渐变和噪声的BGR测试画面，压缩率接近真实摄像头画面"""
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    frame = np.empty((height, width, 3), dtype=np.uint8)
+    frame[..., 0] = (x + y) / 2
+    frame[..., 1] = (x * 0.3 + seed * 7) % 256
+    frame[..., 2] = y
+    noise = rng.integers(0, 24, size=(height, width, 3), dtype=np.uint8)
+    return frame + noise
+
+
+def synthetic_jpeg(width, height, seed=0, quality=80):
+    """生成一帧合成JPEG字节"""
+    import cv2
+    ret, buffer = cv2.imencode('.jpg', synthetic_frame(width, height, seed),
+                               [cv2.IMWRITE_JPEG_QUALITY, quality])
+    assert ret
+    return buffer.tobytes()
+
+
+def measure(fn, iterations):
+    """执行 fn(i) 多次，返回 (墙钟秒数, CPU秒数)"""
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    for i in range(iterations):
+        fn(i)
+    return time.perf_counter() - wall, time.process_time() - cpu
+
+
+def percentile(values, q):
+    """已排序列表的近似分位数"""
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def report(name, frames, wall, cpu):
+    """输出一行结果：帧数、墙钟fps、每核fps"""
+    fps = frames / wall if wall else float('inf')
+    per_core = frames / cpu if cpu else float('inf')
+    print(f"{name:<28} frames={frames:<6} wall={wall:7.3f}s  fps={fps:9.1f}  fps/core={per_core:9.1f}")
+
+
+# 服务端 multipart 分段的分隔行，用于在字节流中数帧
+FRAME_BOUNDARY = b'--frame\r\n'
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_listening(port, timeout=15):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def process_usage(pid):
+    """返回 (CPU秒数, 常驻内存MB)，只支持 Linux /proc"""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        cpu = (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+        with open(f'/proc/{pid}/status') as f:
+            rss = next(int(line.split()[1]) for line in f if line.startswith('VmRSS'))
+        return cpu, rss / 1024
+    except (OSError, StopIteration, IndexError, ValueError):
+        return None, None
+
+
+def start_server(robot_port, video_port, worker='gevent', wait=True):
+    """以子进程启动 serve.py 并指向本机的机器人/摄像头端口，返回 (进程, 监听端口)
+
+    wait 为假时不等待端口开始监听（由调用者自己计时）。
+    """
+    port = free_port()
+    # 不写审计文件，也不读取当前目录下的车队配置
+    env = dict(os.environ, AUDIT_LOG_FILE='', FLEET_CONFIG='')
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'serve.py'), '--worker', worker,
+         '--robot-ip', '127.0.0.1', '--robot-port', str(robot_port), '--video-port', str(video_port),
+         '--listen', f'127.0.0.1:{port}', '--max-connections', '10000'],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if wait and not wait_listening(port):
+        stop_server(proc)
+        raise RuntimeError("server did not start")
+    return proc, port
+
+
+def stop_server(proc):
+    proc.terminate()
+    try:
+        proc.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+# 模拟器写在每帧SOI之后的时间戳注释：FFD8 FFFE <长度> "ts=<Unix时间>"
+FRAME_TIMESTAMP = b'\xff\xd8\xff\xfe'
+_TIMESTAMP_FIELD = re.compile(rb'..ts=([0-9.]+)', re.DOTALL)
+
+
+class Stream:
+    __slots__ = ('sock', 'frames', 'tail', 'first_frame', 'last_frame', 'latencies')
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.frames = 0
+        self.tail = b''
+        self.first_frame = None
+        self.last_frame = None
+        self.latencies = []  # 源时间戳到收到该帧的秒数（开启 track_latency 且帧带时间戳时）
+
+    def fps(self, end=None):
+        """首帧之后的平均帧率；没有收到帧时为0"""
+        if self.first_frame is None:
+            return 0.0
+        end = end or self.last_frame
+        return max(self.frames - 1, 0) / max(end - self.first_frame, 1e-6)
+
+
+class StreamClients:
+    """在一个线程里用 selectors 读取大量 HTTP 长连接（MJPEG/SSE），统计每个连接收到的帧数
+
+    track_latency 为真时解析帧里的 "ts=" 注释，记录源到客户端收到的延迟；跨读取边界的帧不计入。
+    """
+
+    def __init__(self, port, track_latency=False):
+        self.port = port
+        self.track_latency = track_latency
+        self.selector = selectors.DefaultSelector()
+        self.streams = []
+
+    def open(self, path, count):
+        request = f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: keep-alive\r\n\r\n'.encode()
+        opened = []
+        for _ in range(count):
+            sock = socket.create_connection(('127.0.0.1', self.port))
+            sock.setblocking(False)
+            sock.send(request)
+            stream = Stream(sock)
+            self.selector.register(sock, selectors.EVENT_READ, stream)
+            opened.append(stream)
+        self.streams.extend(opened)
+        return opened
+
+    def run(self, duration):
+        end = time.monotonic() + duration
+        while time.monotonic() < end:
+            for key, _ in self.selector.select(timeout=0.1):
+                self._read(key.data)
+        return end
+
+    def _read(self, stream):
+        try:
+            data = stream.sock.recv(1 << 20)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+        if not data:
+            self.selector.unregister(stream.sock)
+            return
+        data = stream.tail + data
+        found = data.count(FRAME_BOUNDARY)
+        if found:
+            now = time.monotonic()
+            if stream.first_frame is None:
+                stream.first_frame = now
+            stream.last_frame = now
+            stream.frames += found
+            if self.track_latency:
+                self._record_latency(stream, data)
+        stream.tail = data[-(len(FRAME_BOUNDARY) - 1):]
+
+    @staticmethod
+    def _record_latency(stream, data):
+        received = time.time()
+        start = data.find(FRAME_TIMESTAMP)
+        while start >= 0:
+            match = _TIMESTAMP_FIELD.match(data, start + len(FRAME_TIMESTAMP))
+            if match and match.end() < len(data):
+                stream.latencies.append(received - float(match.group(1)))
+            start = data.find(FRAME_TIMESTAMP, start + len(FRAME_TIMESTAMP))
+
+    def close(self):
+        self.selector.close()
+        for stream in self.streams:
+            stream.sock.close()
+        self.streams = []
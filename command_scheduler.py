@@ -0,0 +1,102 @@
+import threading
+import time
+from collections import deque
+
+# 走优先通道的紧急命令：插队发送，并丢弃排队中的运动命令
+PRIORITY_COMMANDS = frozenset({'stop', 'sit_down'})
+
+# 按住期间重复发送的运动命令：超出频率的重复直接合并，仍视为接受
+MOTION_COMMANDS = frozenset({'forward', 'backward', 'left', 'right', 'turn_left', 'turn_right'})
+
+# 每种命令每秒最多发送的次数（优先命令不限速）
+DEFAULT_RATE_LIMITS = {
+    'forward': 20,
+    'backward': 20,
+    'left': 20,
+    'right': 20,
+    'turn_left': 20,
+    'turn_right': 20,
+    'stand_up': 2,
+}
+
+
+class CommandScheduler:
+    """机器人发送队列调度
+
+    - 紧急命令（停止、坐下）进入优先通道，清空排队中的普通命令，下次写出时排在最前面；
+    - 队列中已有相同的普通命令时不再重复排队；
+    - 每种普通命令按 rate_limits 限速：超出频率的运动命令合并掉，单次动作命令拒绝并报告给调用者；
+    - 紧急命令之后限速重新计时，停止后马上再发的命令不会被合并。
+    """
+
+    def __init__(self, max_queue=64, priority=PRIORITY_COMMANDS, rate_limits=None, motion=MOTION_COMMANDS):
+        self.max_queue = max_queue
+        self.priority = priority
+        self.motion = motion
+        self.min_interval = {command: 1.0 / rate
+                             for command, rate in (DEFAULT_RATE_LIMITS if rate_limits is None else rate_limits).items()}
+
+        self._lock = threading.Lock()
+        self._urgent = deque()
+        self._normal = deque()
+        self._last_accepted = {}
+
+        # 统计
+        self.deduplicated = 0
+        self.rate_limited = 0
+        self.preempted = 0   # 被紧急命令丢弃的普通命令数
+        self.rejected = 0    # 队列已满被拒绝的命令数
+
+    def __len__(self):
+        with self._lock:
+            return len(self._urgent) + len(self._normal)
+
+    def offer(self, command):
+        """提交一条命令，返回 (是否接受, 是否为紧急命令)；被去重或限速合并的运动命令也视为接受"""
+        name = command.strip()
+        with self._lock:
+            if name in self.priority:
+                self.preempted += len(self._normal)
+                self._normal.clear()
+                self._last_accepted.clear()
+                self._urgent.append(command)
+                return True, True
+
+            if command in self._normal:
+                self.deduplicated += 1
+                return True, False
+
+            now = time.monotonic()
+            interval = self.min_interval.get(name)
+            if interval and now - self._last_accepted.get(name, float('-inf')) < interval:
+                self.rate_limited += 1
+                return name in self.motion, False
+
+            if len(self._urgent) + len(self._normal) >= self.max_queue:
+                self.rejected += 1
+                return False, False
+            self._last_accepted[name] = now
+            self._normal.append(command)
+            return True, False
+
+    def drain(self):
+        """取出全部待发送命令，返回 (命令列表, 是否包含紧急命令)；紧急命令排在最前"""
+        with self._lock:
+            urgent = bool(self._urgent)
+            commands = list(self._urgent) + list(self._normal)
+            self._urgent.clear()
+            self._normal.clear()
+        return commands, urgent
+
+    def clear(self):
+        with self._lock:
+            self._urgent.clear()
+            self._normal.clear()
+
+    def stats(self):
+        return {
+            'deduplicated': self.deduplicated,
+            'rate_limited': self.rate_limited,
+            'preempted': self.preempted,
+            'rejected': self.rejected,
+        }
@@ -0,0 +1,21 @@
+"""服务器和Qt客户端共用的轻量逻辑：命令协议、视频地址和视频流状态
+
+只依赖标准库，两个入口启动时导入它不增加负担；OpenCV、NumPy、requests 等视频依赖
+由 frame_codec、stream_reader 等模块在第一次真正处理视频时才加载。
+"""
+
+# 视频流状态
+CONNECTING = 'connecting'
+STREAMING = 'streaming'
+STALLED = 'stalled'
+STOPPED = 'stopped'
+
+
+def command_line(command):
+    """机器人控制端口的协议：每条命令一行文本，以UTF-8发送"""
+    return command if command.endswith('\n') else command + '\n'
+
+
+def video_url(host, port):
+    """机器人摄像头的MJPEG地址"""
+    return f"http://{host}:{port}"
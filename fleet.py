@@ -0,0 +1,254 @@
+import json
+import logging
+import os
+import socket
+import time
+
+from core import video_url
+from hold_repeater import HoldRepeater
+from recorder import FrameRecorder
+from robot_link import RobotLink, CONNECTED
+from status_bus import StatusBus
+from video_hub import VideoHub
+from video_latency import VideoLatency
+from video_profiles import VariantCache
+
+
+class Robot:
+    """一台机器人的运行时状态：连接管理器、按住重复器、视频广播器、编码缓存、录像和状态
+
+    所有机器人的连接和按住重复节拍都运行在同一个 I/O 循环里；
+    视频读取线程只在该机器人有观看者时存在。
+    """
+
+    def __init__(self, robot_id, host, port, video_port, name=None, loop=None,
+                 send_queue=64, connect_timeout=5.0, hold_rate_hz=10, deadman_timeout=1.5,
+                 variant_idle_ttl=30, video_stall_timeout=2.0, video_latency_window=10.0,
+                 recording_dir='recordings', recording_segment_size=64 * 1024 * 1024, recording_segments=16):
+        self.id = robot_id
+        self.name = name or robot_id
+        self.host = host
+        self.port = port
+        self.video_port = video_port
+        self.connect_timeout = connect_timeout
+
+        # 共享状态：只在内容变化时发布新版本，/api/status 直接读缓存，/api/status/stream 推送增量
+        self.status = StatusBus({
+            'connected': False,
+            'last_command': None,
+            'last_command_time': None,
+            'total_commands': 0,
+            'failed_commands': 0,
+            'video': 'stopped'  # 上游视频读取状态：connecting / streaming / stalled / stopped
+        })
+        self.link = RobotLink(host, port, loop=loop, max_queue=send_queue, connect_timeout=connect_timeout,
+                              on_state_change=lambda state: self.status.update(connected=state == CONNECTED),
+                              metric_labels={'robot': robot_id})
+        self.hold = HoldRepeater(self.send, rate_hz=hold_rate_hz, deadman_timeout=deadman_timeout,
+                                 loop=self.link.loop)
+        # 帧到达、写出给网页客户端的延迟；/api/metrics 中按机器人区分
+        self.latency = VideoLatency(video_latency_window, metric='video_latency_seconds', robot=robot_id)
+        self.video = VideoHub(video_url(host, video_port), stall_timeout=video_stall_timeout,
+                              on_state=lambda state: self.status.update(video=state), latency=self.latency)
+        self.variants = VariantCache(idle_ttl=variant_idle_ttl)
+        self.recorder = FrameRecorder(self.video, recording_dir, recording_segment_size, recording_segments)
+        self.analytics = None  # FrameAnalytics，启用时由 start_analytics 创建
+
+    def record_command(self, command=None, success=True):
+        """记录命令结果（有变化才发布新版本）并返回缓存的状态快照"""
+        if command:
+            counters = {'total_commands': 1}
+            if not success:
+                counters['failed_commands'] = 1
+            self.status.increment(counters, last_command=str(command).strip(),
+                                  last_command_time=time.strftime('%H:%M:%S'))
+        return self.status.snapshot()[1]
+
+    def connect(self):
+        """连接到机器人（由连接管理器在I/O线程中完成，断线后自动重连）"""
+        try:
+            logging.info(f"Attempting to connect to robot {self.id} at {self.host}:{self.port}")
+
+            # 检查IP地址格式
+            try:
+                socket.inet_aton(self.host)
+            except socket.error:
+                logging.error(f"Invalid IP address format: {self.host}")
+                raise ValueError(f"Invalid IP address: {self.host}")
+
+            # 检查端口范围
+            if not (0 <= self.port <= 65535):
+                logging.error(f"Invalid port number: {self.port}")
+                raise ValueError("Port number must be between 0 and 65535")
+
+            success = self.link.connect(wait=self.connect_timeout)
+            if success:
+                logging.info(f"Successfully connected to robot {self.id}")
+            else:
+                logging.error(f"Connection to robot {self.id} failed: {self.link.last_error or 'timed out'}, "
+                              f"retrying in background")
+            self.record_command('connect', success)
+            return success
+
+        except Exception as e:
+            logging.error(f"Connection failed: {str(e)}")
+            self.record_command('connect', False)
+            return False
+
+    def disconnect(self):
+        """断开与机器人的连接"""
+        self.hold.release()
+        self.link.disconnect()
+
+    def send(self, command):
+        """发送命令到机器人：只放入连接管理器的发送队列，不阻塞请求线程"""
+        try:
+            if not isinstance(command, str):
+                logging.error(f"Invalid command type: {type(command)}, expected string")
+                raise TypeError("Command must be a string")
+
+            # 确保命令格式正确
+            if not command.strip():
+                logging.error("Empty command")
+                raise ValueError("Command cannot be empty")
+
+            if not self.link.connected:
+                logging.error(f"No connection to robot {self.id}")
+                self.record_command(command, False)
+                return False
+
+            success = self.link.send(command)
+            if not success:
+                logging.error(f"Failed to queue command for robot {self.id}: {command.strip()}")
+            self.record_command(command, success)
+            return success
+
+        except Exception as e:
+            logging.error(f"Failed to send command: {str(e)}")
+            self.record_command(command, False)
+            return False
+
+    def dispatch(self, command, event=None, client=None):
+        """执行一条命令，返回 (是否成功, 提示信息)
+
+        event 为 press/release/heartbeat 时交给按住移动重复器处理，其余为单次命令。
+        """
+        if command == 'connect':
+            return self.connect(), None
+        if command == 'disconnect':
+            self.disconnect()
+            return True, None
+        if not self.link.connected:
+            return False, 'Not connected to robot'
+        if event == 'heartbeat':
+            alive = self.hold.heartbeat(client)
+            return alive, None if alive else 'Not holding'
+        if event == 'release':
+            success = self.hold.release(client)
+            return success, 'Released' if success else 'Failed to send command'
+        if event == 'press':
+            success = self.hold.press(command, client)
+        else:
+            # 单次命令（停止、站立、坐下）优先，先结束正在进行的按住移动
+            self.hold.cancel()
+            success = self.send(command)
+        return success, 'Command sent' if success else 'Failed to send command'
+
+    def summary(self):
+        """车队总览中的一行"""
+        return {
+            'id': self.id,
+            'name': self.name,
+            'host': self.host,
+            'link': self.link.state,
+            'holding': self.hold.active_command,
+            'viewers': self.video.viewers,
+            **self.status.snapshot()[1],
+        }
+
+    def start_analytics(self, pool, **options):
+        """启动旁路帧分析，结果作为状态里的 analytics 字段推送给客户端"""
+        from frame_analytics import FrameAnalytics
+
+        self.analytics = FrameAnalytics(self.video, pool,
+                                        on_result=lambda result: self.status.update(analytics=result), **options)
+        self.analytics.start()
+
+    def shutdown(self, timeout=2.0):
+        """停止按住移动并把已排队的停止命令写给机器人，再关闭视频和录像"""
+        self.hold.release()
+        self.hold.close()
+        self.link.disconnect()
+        if not self.link.wait_disconnected(timeout):
+            logging.error(f"Robot link {self.id} did not close in time")
+        self.status.close()
+        self.recorder.stop()
+        if self.analytics:
+            self.analytics.stop()
+        self.video.stop()
+
+
+class Fleet:
+    """机器人注册表，按配置顺序保存；第一台为默认机器人（不带 /robot/<id> 前缀的接口使用它）"""
+
+    def __init__(self, robots=()):
+        self._robots = {}
+        for robot in robots:
+            self.add(robot)
+
+    def add(self, robot):
+        if robot.id in self._robots:
+            raise ValueError(f"Duplicate robot id: {robot.id}")
+        self._robots[robot.id] = robot
+
+    def get(self, robot_id):
+        return self._robots.get(robot_id)
+
+    @property
+    def default(self):
+        return next(iter(self._robots.values()), None)
+
+    def __iter__(self):
+        return iter(list(self._robots.values()))
+
+    def __len__(self):
+        return len(self._robots)
+
+    def summary(self):
+        robots = [robot.summary() for robot in self]
+        return {
+            'robots': robots,
+            'total': len(robots),
+            'connected': sum(1 for robot in robots if robot['connected']),
+        }
+
+    def shutdown(self, timeout=2.0):
+        for robot in self:
+            robot.shutdown(timeout)
+
+
+def load_fleet_config(path):
+    """读取车队配置，返回机器人参数列表
+
+    文件格式: {"robots": [{"id": "dog1", "host": "192.168.2.34", "port": 8082, "video_port": 8080, "name": "..."}]}
+    文件不存在时返回 None。
+    """
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        config = json.load(f)
+    specs = []
+    for entry in config.get('robots', []):
+        try:
+            specs.append({
+                'robot_id': str(entry['id']),
+                'host': entry['host'],
+                'port': int(entry.get('port', 8082)),
+                'video_port': int(entry.get('video_port', 8080)),
+                'name': entry.get('name'),
+            })
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"Invalid robot entry in {path}: {entry!r}") from e
+    if not specs:
+        raise ValueError(f"No robots defined in {path}")
+    return specs
@@ -0,0 +1,229 @@
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# 工作进程里按名字缓存已映射的共享内存，避免每个任务重新 mmap
+_attached = {}
+
+
+def _view(name, shape):
+    shm = _attached.get(name)
+    if shm is None:
+        shm = _attached[name] = shared_memory.SharedMemory(name=name)
+    return np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+
+
+def analyze_frames(current, previous, shape, threshold, grid, edge_threshold):
+    """在工作进程中运行：比较两帧缩小后的灰度图，返回运动和近处障碍线索
+
+    current/previous 是共享内存名（previous 为 None 时只计算障碍线索）；
+    只用 NumPy 向量运算，工作进程不需要导入 OpenCV。
+    """
+    frame = _view(current, shape)
+    height, width = shape
+    result = {'brightness': round(float(frame.mean()), 1)}
+
+    if previous is not None:
+        # 帧差超过阈值的像素视为运动；再按网格统计每格运动像素的比例（百分比）
+        mask = np.abs(frame.astype(np.int16) - _view(previous, shape)) > threshold
+        rows, cols = grid
+        cells = mask[:height // rows * rows, :width // cols * cols]
+        cells = cells.reshape(rows, height // rows, cols, width // cols).mean(axis=(1, 3))
+        result['motion'] = round(float(mask.mean()), 4)
+        result['motion_cells'] = np.rint(cells * 100).astype(int).tolist()
+
+    # 障碍线索：画面下方中间（机器人正前方的地面）的水平梯度密度，近处有物体时明显升高
+    band = frame[height * 2 // 3:, width // 3:width * 2 // 3].astype(np.int16)
+    edges = np.abs(np.diff(band, axis=1)) > edge_threshold
+    result['near_edges'] = round(float(edges.mean()), 4)
+    return result
+
+
+def create_pool(workers):
+    """分析用的进程池；使用 spawn，不从多线程的服务进程 fork"""
+    return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+
+
+class FrameAnalytics:
+    """旁路帧分析：按固定频率从视频广播器取样，交给进程池做运动检测和障碍线索
+
+    作为广播器的普通订阅者在自己的线程中取样，直播路径上没有额外工作。
+    取样帧以缩小的灰度图写入共享内存槽位，工作进程直接映射读取，不经过管道复制像素；
+    在途任务达到 max_in_flight 或没有空闲槽位时直接跳过这一帧，不排队。
+    """
+
+    def __init__(self, hub, pool, on_result=None, rate_hz=2, max_in_flight=2, size=(160, 120),
+                 motion_threshold=25, grid=(4, 4), edge_threshold=40, obstacle_edges=0.12, retry_delay=1.0):
+        self.hub = hub
+        self.pool = pool
+        self.on_result = on_result  # on_result(dict)，在进程池的回调线程中调用
+        self.period = 1.0 / rate_hz
+        self.max_in_flight = max_in_flight
+        self.width, self.height = size
+        self.motion_threshold = motion_threshold
+        self.grid = grid
+        self.edge_threshold = edge_threshold
+        self.obstacle_edges = obstacle_edges  # near_edges 超过该比例时报告 obstacle
+        self.retry_delay = retry_delay
+
+        # 槽位引用计数：在途任务各持有当前帧和上一帧，另外保留最近一帧作为下一次比较的基准
+        # 在途任务最多 max_in_flight 个，max_in_flight + 2 个槽位保证取样时总有空闲槽位
+        self._slots = []
+        self._views = []
+        self._refs = []
+        self._free = []
+        self._previous = None
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)  # 在途任务全部结束时通知
+        self._running = False
+        self._thread = None
+        self._cursor = None
+
+        self.frames_sampled = 0
+        self.frames_skipped = 0  # 工作进程忙而跳过的取样帧
+        self.frames_analyzed = 0
+        self.errors = 0
+        self.last_result = None
+
+    def start(self):
+        if self._running:
+            return
+        shape = (self.height, self.width)
+        for index in range(self.max_in_flight + 2):
+            shm = shared_memory.SharedMemory(create=True, size=self.width * self.height)
+            self._slots.append(shm)
+            self._views.append(np.ndarray(shape, dtype=np.uint8, buffer=shm.buf))
+            self._refs.append(0)
+            self._free.append(index)
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="frame-analytics", daemon=True)
+        self._thread.start()
+        logging.info(f"Frame analytics sampling {1 / self.period:g} fps at {self.width}x{self.height}")
+
+    def stop(self, timeout=2.0):
+        """停止取样，等在途任务的回调结束后再释放共享内存槽位"""
+        self._running = False
+        if self._cursor:
+            self._cursor.close()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+        with self._lock:
+            if not self._idle.wait_for(lambda: self._in_flight == 0, timeout):
+                logging.warning(f"Frame analytics stopping with {self._in_flight} tasks in flight")
+            self._views = []
+            self._refs = []
+            self._free = []
+            self._previous = None
+        for shm in self._slots:
+            shm.close()
+            shm.unlink()
+        self._slots = []
+
+    def _run(self):
+        # 解码只在服务进程里需要，工作进程导入本模块时不加载 OpenCV
+        from frame_codec import decode_gray
+
+        next_sample = time.monotonic()
+        while self._running:
+            self._cursor = self.hub.subscribe()
+            for jpg in self._cursor:
+                if not self._running:
+                    break
+                now = time.monotonic()
+                if now < next_sample:
+                    continue
+                # 落后时从现在重新计时，不补采
+                next_sample = max(next_sample + self.period, now)
+                self.frames_sampled += 1
+                self._offer(decode_gray, jpg)
+            self._cursor.close()
+            if self._running:
+                time.sleep(self.retry_delay)
+
+    def _offer(self, decode_gray, jpg):
+        with self._lock:
+            if self._in_flight >= self.max_in_flight or not self._free:
+                self.frames_skipped += 1
+                return
+            index = self._free.pop()
+            self._refs[index] = 1  # 本次任务持有
+        if not decode_gray(jpg, self._views[index]):
+            self._release(index)
+            return
+
+        with self._lock:
+            previous = self._previous
+            if previous is not None:
+                self._refs[previous] += 1  # 本次任务持有上一帧，原先“基准帧”的引用下面释放
+            self._refs[index] += 1  # 成为下一次比较的基准帧
+            self._previous = index
+            self._in_flight += 1
+        if previous is not None:
+            self._release(previous)
+
+        submitted = time.monotonic()
+        try:
+            future = self.pool.submit(analyze_frames, self._slots[index].name,
+                                      self._slots[previous].name if previous is not None else None,
+                                      (self.height, self.width), self.motion_threshold, self.grid,
+                                      self.edge_threshold)
+        except (BrokenProcessPool, RuntimeError) as e:
+            logging.error(f"Frame analytics pool unavailable: {str(e)}")
+            self._running = False
+            self._finish(index, previous)
+            return
+        future.add_done_callback(lambda f: self._done(f, index, previous, submitted))
+
+    def _done(self, future, index, previous, submitted):
+        self._finish(index, previous)
+        if not self._running:
+            return
+        try:
+            result = future.result()
+        except Exception as e:
+            self.errors += 1
+            logging.error(f"Frame analysis failed: {str(e)}")
+            return
+        result['obstacle'] = result['near_edges'] > self.obstacle_edges
+        result['time'] = round(time.time(), 3)
+        result['latency_ms'] = round((time.monotonic() - submitted) * 1000, 1)
+        self.frames_analyzed += 1
+        self.last_result = result
+        if self.on_result:
+            self.on_result(result)
+
+    def _finish(self, index, previous):
+        self._release(index)
+        if previous is not None:
+            self._release(previous)
+        with self._lock:
+            self._in_flight -= 1
+            if self._in_flight == 0:
+                self._idle.notify_all()
+
+    def _release(self, index):
+        with self._lock:
+            if not self._refs:
+                return  # stop() 等待超时后槽位已释放
+            self._refs[index] -= 1
+            if self._refs[index] == 0:
+                self._free.append(index)
+
+    def stats(self):
+        return {
+            'running': self._running,
+            'rate_hz': round(1 / self.period, 2),
+            'frames_sampled': self.frames_sampled,
+            'frames_skipped': self.frames_skipped,
+            'frames_analyzed': self.frames_analyzed,
+            'errors': self.errors,
+            'in_flight': self._in_flight,
+            'last_result': self.last_result,
+        }
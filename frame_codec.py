@@ -0,0 +1,172 @@
+import threading
+import time
+import cv2
+import numpy as np
+from mjpeg import jpeg_dimensions
+
+# 解码时直接缩小的倍数及对应标志，libjpeg 在 DCT 阶段完成缩小，比全尺寸解码再缩放省得多
+REDUCED_DECODE_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+REDUCED_GRAYSCALE_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+    (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+    (2, cv2.IMREAD_REDUCED_GRAYSCALE_2),
+)
+
+
+def decode_jpeg(jpg, flags=cv2.IMREAD_COLOR):
+    """解码JPEG字节，失败返回 None"""
+    return cv2.imdecode(np.frombuffer(jpg, dtype=np.uint8), flags)
+
+
+def decode_scale(source_size, target_size):
+    """选择解码缩小倍数：保持宽高比缩放到目标尺寸内后，缩小解码的结果仍不小于显示尺寸
+
+    目标某一边为0表示该方向不限制。
+    """
+    if not source_size or not target_size:
+        return 1
+    src_w, src_h = source_size
+    ratios = [target / source for target, source in zip(target_size, source_size) if target > 0 and source > 0]
+    if not ratios:
+        return 1
+    scale = min(ratios)
+    display_w, display_h = src_w * scale, src_h * scale
+    for factor, _ in REDUCED_DECODE_FLAGS:
+        if src_w // factor >= display_w and src_h // factor >= display_h:
+            return factor
+    return 1
+
+
+def decode_flags(factor, grayscale=False):
+    """缩小倍数对应的 imdecode 标志"""
+    for scale, flags in REDUCED_GRAYSCALE_FLAGS if grayscale else REDUCED_DECODE_FLAGS:
+        if scale == factor:
+            return flags
+    return cv2.IMREAD_GRAYSCALE if grayscale else cv2.IMREAD_COLOR
+
+
+def decode_gray(jpg, out):
+    """以缩小分辨率解码为灰度图，缩放到 out 的尺寸后写入 out（例如共享内存）；失败返回 False"""
+    height, width = out.shape
+    gray = decode_jpeg(jpg, decode_flags(decode_scale(jpeg_dimensions(jpg), (width, height)), grayscale=True))
+    if gray is None:
+        return False
+    if gray.shape == out.shape:
+        np.copyto(out, gray)
+    else:
+        cv2.resize(gray, (width, height), dst=out, interpolation=cv2.INTER_AREA)
+    return True
+
+
+class DecodeScalePolicy:
+    """按显示尺寸选择解码缩小倍数；目标尺寸或源尺寸变化时重新计算"""
+
+    def __init__(self, target_size=(0, 0)):
+        self.target_size = target_size
+        self.source_size = None
+        self.factor = 1
+        self.flags = cv2.IMREAD_COLOR
+        self._stale = True
+
+    def set_target(self, width, height):
+        """更新目标尺寸（例如窗口大小变化），下一帧重新选择倍数"""
+        if (width, height) != self.target_size:
+            self.target_size = (width, height)
+            self._stale = True
+
+    def decode(self, jpg):
+        """按当前策略解码，返回BGR图像或 None"""
+        size = jpeg_dimensions(jpg)
+        if self._stale or size != self.source_size:
+            self.source_size = size
+            self.factor = decode_scale(size, self.target_size)
+            self.flags = decode_flags(self.factor)
+            self._stale = False
+        return decode_jpeg(jpg, self.flags)
+
+
+class FrameBufferPool:
+    """按尺寸复用的帧缓冲区，避免每帧重新分配内存"""
+
+    def __init__(self, capacity=3):
+        self.capacity = capacity
+        self.shape = None
+        self.free = []
+        self.lock = threading.Lock()
+
+    def acquire(self, shape):
+        """取一块指定尺寸的空闲缓冲区，尺寸变化时丢弃旧缓冲"""
+        with self.lock:
+            if shape != self.shape:
+                self.shape = shape
+                self.free = []
+            if self.free:
+                return self.free.pop()
+        return np.empty(shape, dtype=np.uint8)
+
+    def release(self, buffer):
+        """归还缓冲区"""
+        with self.lock:
+            if buffer.shape == self.shape and len(self.free) < self.capacity:
+                self.free.append(buffer)
+
+
+def render_rgb(frame, target_size, pool):
+    """缩放到目标尺寸内（保持宽高比）并转换为RGB，结果写入从 pool 取出的缓冲区
+
+    目标某一边为0时保持原尺寸。
+    """
+    src_h, src_w = frame.shape[:2]
+    width, height = target_size
+    if width > 0 and height > 0:
+        scale = min(width / src_w, height / src_h)
+        width, height = max(1, int(src_w * scale)), max(1, int(src_h * scale))
+    else:
+        width, height = src_w, src_h
+
+    buffer = pool.acquire((height, width, 3))
+    if (width, height) != (src_w, src_h):
+        interpolation = cv2.INTER_AREA if width < src_w else cv2.INTER_LINEAR
+        cv2.resize(frame, (width, height), dst=buffer, interpolation=interpolation)
+        cv2.cvtColor(buffer, cv2.COLOR_BGR2RGB, dst=buffer)
+    else:
+        cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=buffer)
+    return buffer
+
+
+def encode_jpeg(frame, quality=None):
+    """编码为JPEG字节，失败返回 None"""
+    params = [cv2.IMWRITE_JPEG_QUALITY, int(quality)] if quality else []
+    ret, buffer = cv2.imencode('.jpg', frame, params)
+    return buffer.tobytes() if ret else None
+
+
+def draw_overlay(frame, text=None):
+    """在画面左上角叠加文字（默认当前时间）"""
+    text = text or time.strftime('%H:%M:%S')
+    cv2.putText(frame, text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 0), 3, cv2.LINE_AA)
+    cv2.putText(frame, text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 1, cv2.LINE_AA)
+    return frame
+
+
+def transform_jpeg(jpg, width=None, quality=None, overlay=False):
+    """解码 -> 缩放/叠加 -> 重新编码；解码失败返回 None
+
+    需要缩小时按目标宽度直接以 1/2、1/4、1/8 分辨率解码。
+    """
+    flags = cv2.IMREAD_COLOR
+    if width:
+        flags = decode_flags(decode_scale(jpeg_dimensions(jpg), (width, 0)))
+    frame = decode_jpeg(jpg, flags)
+    if frame is None:
+        return None
+    if width and frame.shape[1] > width:
+        height = max(1, round(frame.shape[0] * width / frame.shape[1]))
+        frame = cv2.resize(frame, (int(width), height), interpolation=cv2.INTER_AREA)
+    if overlay:
+        draw_overlay(frame, overlay if isinstance(overlay, str) else None)
+    return encode_jpeg(frame, quality)
@@ -0,0 +1,145 @@
+import threading
+import logging
+import time
+
+
+class HoldRepeater:
+    """服务器端按住移动：客户端只发按下/松开/心跳，由服务器按固定节拍重复发送运动命令
+
+    节拍按 起点 + n*周期 计算，不会因为发送耗时而累积漂移；
+    超过 deadman_timeout 没有收到持有者的心跳时自动发送停止命令。
+    给出 loop（robot_link.IOLoop）时节拍作为定时回调在该循环中执行，多台机器人共享一个线程；
+    否则按需启动一个专用线程。
+    """
+
+    def __init__(self, send, rate_hz=10.0, deadman_timeout=1.5, stop_command='stop', loop=None):
+        self.send = send  # 实际发送命令的函数，send(command) -> bool
+        self.loop = loop
+        self.period = 1.0 / rate_hz
+        self.deadman_timeout = deadman_timeout
+        self.stop_command = stop_command
+
+        self._cond = threading.Condition()
+        self._command = None     # 当前按住的命令
+        self._owner = None       # 按住该命令的客户端
+        self._heartbeat = 0.0    # 最近一次心跳的单调时间
+        self._next_tick = None   # 下一次重复发送的单调时间
+        self._scheduled = False  # 是否已有定时回调在I/O循环中等待
+        self._thread = None
+        self._closed = False
+
+        self.repeats = 0         # 服务器代发的重复命令数
+        self.deadman_stops = 0   # 因心跳超时自动停止的次数
+
+    @property
+    def active_command(self):
+        with self._cond:
+            return self._command
+
+    def press(self, command, owner=None):
+        """按下：立即发送一次，之后由后台线程按节拍重复"""
+        with self._cond:
+            self._command = command
+            self._owner = owner
+            self._heartbeat = time.monotonic()
+            # 本次按下立即发送，下一次重复在一个周期之后
+            self._next_tick = self._heartbeat + self.period
+            if self.loop is not None:
+                if not self._scheduled and not self._closed:
+                    self._scheduled = True
+                    self.loop.call_later(self.period, self._tick)
+            elif self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="hold-repeater", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+        return self.send(command)
+
+    def heartbeat(self, owner=None):
+        """持有者的心跳，返回当前是否仍在按住"""
+        with self._cond:
+            if self._command is None or (owner is not None and owner != self._owner):
+                return False
+            self._heartbeat = time.monotonic()
+            return True
+
+    def release(self, owner=None):
+        """松开：停止重复并发送停止命令；owner 不匹配时忽略（其他客户端正在按住）"""
+        with self._cond:
+            if owner is not None and self._owner is not None and owner != self._owner:
+                return False
+            was_active = self._command is not None
+            self._command = None
+            self._owner = None
+            self._cond.notify_all()
+        if was_active:
+            return self.send(self.stop_command)
+        return True
+
+    def cancel(self):
+        """取消按住但不发送停止命令（例如随后要发送的单次命令会覆盖当前运动）"""
+        with self._cond:
+            self._command = None
+            self._owner = None
+            self._cond.notify_all()
+
+    def close(self):
+        """停止后台线程"""
+        with self._cond:
+            self._closed = True
+            self._command = None
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout=1)
+
+    def _advance(self, now):
+        """节拍到达（持有锁时调用）：返回要发送的命令并推进下一节拍"""
+        command = self._command
+        if now - self._heartbeat > self.deadman_timeout:
+            logging.warning(f"No heartbeat for {now - self._heartbeat:.2f}s, stopping '{command}'")
+            self._command = None
+            self._owner = None
+            self.deadman_stops += 1
+            command = self.stop_command
+        else:
+            self.repeats += 1
+
+        self._next_tick += self.period
+        if self._next_tick < now:
+            # 发送被阻塞过久时重新对齐，不补发错过的节拍
+            self._next_tick = now + self.period
+        return command
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._closed:
+                    return
+                if self._command is None:
+                    self._cond.wait()
+                    continue
+
+                now = time.monotonic()
+                if now < self._next_tick:
+                    self._cond.wait(self._next_tick - now)
+                    continue
+                command = self._advance(now)
+
+            self.send(command)
+
+    def _tick(self):
+        """I/O循环中的定时回调：到点发送，仍在按住时预约下一节拍"""
+        command = None
+        with self._cond:
+            if self._closed or self._command is None:
+                self._scheduled = False
+                return
+            now = time.monotonic()
+            if now >= self._next_tick:
+                command = self._advance(now)
+            if self._command is None:
+                self._scheduled = False
+            else:
+                self.loop.call_later(max(0.0, self._next_tick - now), self._tick)
+
+        if command is not None:
+            self.send(command)
@@ -1,48 +1,140 @@
+import os
 import sys
-from PyQt5.QtWidgets import (QApplication, QWidget, QPushButton, QLabel, QVBoxLayout, QHBoxLayout, QGridLayout)
+import threading
+import time
+from PyQt5.QtWidgets import (QApplication, QWidget, QPushButton, QLabel, QCheckBox, QVBoxLayout, QHBoxLayout,
+                             QGridLayout)
 from PyQt5.QtGui import QImage, QPixmap
 from PyQt5.QtCore import QThread, pyqtSignal, Qt, QTimer
 from PyQt5.QtNetwork import QTcpSocket
-import requests
-import cv2
-import numpy as np
+from core import CONNECTING, STALLED, STOPPED, STREAMING, command_line, video_url
+from mjpeg import DEFAULT_CHUNK_SIZE
+from video_latency import VideoLatency
+
+# 视频流状态提示
+VIDEO_STATE_TEXT = {
+    CONNECTING: "正在连接视频流...",
+    STREAMING: "视频流正常",
+    STALLED: "视频流中断，正在重连...",
+    STOPPED: "视频流已停止",
+}
+
+# 延迟叠加层显示的阶段：camera 源到到达（需要帧带时间戳）、display 到达到绘制、total 源到绘制
+OVERLAY_STAGES = ('camera', 'decode', 'scale', 'paint', 'display', 'total')
 
 # 视频流处理线程类
 class StreamThread(QThread):
-    frame_received = pyqtSignal(np.ndarray)  # 信号用于传递视频帧
+    frame_ready = pyqtSignal()  # 有新帧可取；未被取走前不会重复发送
+    state_changed = pyqtSignal(str)  # 视频流状态：connecting / streaming / stalled / stopped
 
-    def __init__(self, url):
+    def __init__(self, url, chunk_size=DEFAULT_CHUNK_SIZE, stall_timeout=2.0):
         super().__init__()
         self.url = url
+        self.chunk_size = chunk_size  # 每次读取的最大字节数
+        self.stall_timeout = stall_timeout
         self.running = True  # 控制线程是否继续运行
-        self.bytes_data = b""  # 缓冲区存储接收的字节流
+        # 读取器、缓冲池和解码策略依赖 OpenCV/NumPy/requests，在 run() 中创建，窗口不必等它们加载
+        self.stream = None
+        self.pool = None
+        self.decode_policy = None
+
+        # 最新帧槽位：界面只绘制最新一帧，来不及绘制的帧直接覆盖
+        self.lock = threading.Lock()
+        self.latest = None
+        self.latest_info = None
+        self.frame_info = None  # 界面最近取走那一帧的 (到达时间, 源时间戳)
+        self.notified = False
+        self.target_size = (0, 0)  # 显示区域尺寸，由界面线程更新
+
+        # 每帧以到达解析器的时间为基准，统计解码、缩放和绘制的延迟
+        self.latency = VideoLatency()
+
+        # 统计计数
+        self.frames_decoded = 0
+        self.frames_rendered = 0
+        self.frames_dropped = 0
+
+    def set_target_size(self, width, height):
+        """设置显示区域尺寸，后续帧在工作线程中按该尺寸选择解码倍数并缩放"""
+        self.target_size = (width, height)
 
     def run(self):
-        try:
-            # 发起HTTP请求，持续读取视频流数据
-            with requests.get(self.url, stream=True, timeout=5) as response:
-                for chunk in response.iter_content(chunk_size=1024):
-                    if not self.running:
-                        break
-
-                    # 累加字节流数据
-                    self.bytes_data += chunk
-                    a = self.bytes_data.find(b'\xff\xd8')  # JPEG起始标志
-                    b = self.bytes_data.find(b'\xff\xd9')  # JPEG结束标志
-
-                    # 当发现完整的JPEG图像时，解码并发送信号
-                    if a != -1 and b != -1:
-                        jpg = self.bytes_data[a:b+2]
-                        self.bytes_data = self.bytes_data[b+2:]
-                        frame = cv2.imdecode(np.frombuffer(jpg, dtype=np.uint8), cv2.IMREAD_COLOR)
-                        if frame is not None:
-                            self.frame_received.emit(frame)  # 发送图像帧
-        except Exception as e:
-            print(f"Stream error: {e}")
+        # 视频依赖在工作线程中加载，界面线程此时已经显示窗口并发起机器人连接
+        from frame_codec import DecodeScalePolicy, FrameBufferPool
+        from stream_reader import SupervisedStream
+
+        self.pool = FrameBufferPool()
+        self.decode_policy = DecodeScalePolicy()  # 按显示尺寸选择缩小解码倍数
+        # 断线、卡住超过 stall_timeout 秒都会自动重连，摄像头恢复后一秒内重新出画
+        stream = SupervisedStream(self.url, self.handle_jpeg, on_state=self.state_changed.emit,
+                                  chunk_size=self.chunk_size, stall_timeout=self.stall_timeout)
+        with self.lock:
+            if not self.running:
+                return
+            self.stream = stream
+        # 持续读取视频流，直到 stop()
+        stream.run()
+
+    def handle_jpeg(self, jpg):
+        """每解析出一帧完整的JPEG图像，解码、转换后放入最新帧槽位"""
+        if not self.running:
+            self.stream.stop()
+            return
+        arrival = time.time()
+        source = self.latency.frame(jpg, arrival)
+        started = time.perf_counter()
+        self.decode_policy.set_target(*self.target_size)
+        frame = self.decode_policy.decode(jpg)
+        if frame is not None:
+            self.frames_decoded += 1
+            decoded = time.perf_counter()
+            self.latency.observe('decode', decoded - started)
+            buffer = self.render(frame)
+            self.latency.observe('scale', time.perf_counter() - decoded)
+            self.publish(buffer, (arrival, source))
+
+    def render(self, frame):
+        """缩放到显示区域（保持宽高比）并转换为RGB，结果写入缓冲池"""
+        from frame_codec import render_rgb
+        return render_rgb(frame, self.target_size, self.pool)
+
+    def publish(self, buffer, info=None):
+        """放入最新帧槽位，只有界面已取走上一帧时才发信号"""
+        with self.lock:
+            replaced = self.latest
+            self.latest = buffer
+            self.latest_info = info
+            notify = not self.notified
+            self.notified = True
+        if replaced is not None:
+            self.frames_dropped += 1
+            self.pool.release(replaced)
+        if notify:
+            self.frame_ready.emit()
+
+    def take_frame(self):
+        """界面线程取走最新帧，用完后需调用 release_frame 归还"""
+        with self.lock:
+            buffer = self.latest
+            self.latest = None
+            self.notified = False
+            if buffer is not None:
+                self.frame_info = self.latest_info
+        if buffer is not None:
+            self.frames_rendered += 1
+        return buffer
+
+    def release_frame(self, buffer):
+        """归还界面线程用完的帧缓冲"""
+        self.pool.release(buffer)
 
     def stop(self):
         """停止线程"""
-        self.running = False
+        with self.lock:
+            self.running = False
+            stream = self.stream
+        if stream is not None:
+            stream.stop()
         self.quit()
         self.wait()
 
@@ -62,17 +154,28 @@ class RobotControlUI(QWidget):
         self.socket.disconnected.connect(self.on_disconnected)
         self.socket.errorOccurred.connect(self.on_error)
 
-        # 命令发送定时器
+        # 命令发送定时器（本客户端直连机器人，由它自己按节拍重复；使用精确定时器减少抖动）
         self.command_timer = QTimer()
+        self.command_timer.setTimerType(Qt.PreciseTimer)
         self.command_timer.timeout.connect(self.send_current_command)
         self.current_command = None
 
         # 初始化UI
         self.initUI()
 
-        # 初始化视频流线程
-        self.stream_thread = StreamThread(f"http://{server_ip}:{video_port}")
-        self.stream_thread.frame_received.connect(self.update_video_frame)
+        # 视频流线程在 start() 中启动
+        self.stream_thread = StreamThread(video_url(server_ip, video_port))
+        self.stream_thread.frame_ready.connect(self.update_video_frame)
+        self.stream_thread.state_changed.connect(self.update_video_state)
+
+        # 每秒刷新渲染/丢帧统计
+        self.stats_timer = QTimer()
+        self.stats_timer.timeout.connect(self.update_video_stats)
+        self.stats_timer.start(1000)
+
+    def start(self):
+        """窗口显示后调用：先发起机器人连接，再在后台线程加载视频组件并打开视频流"""
+        self.connect_to_server()
         self.stream_thread.start()
 
     def initUI(self):
@@ -80,13 +183,31 @@ class RobotControlUI(QWidget):
         self.video_view = QLabel("正在连接视频流...")
         self.video_view.setMinimumSize(640, 480)  # 设置最小尺寸
         self.video_view.setAlignment(Qt.AlignCenter)
+        self.video_stats = QLabel("")
+
+        # 延迟叠加层：画面左上角显示帧率和各阶段 p50/p95
+        self.latency_overlay = QLabel(self.video_view)
+        self.latency_overlay.setStyleSheet(
+            "QLabel { background-color: rgba(0, 0, 0, 150); color: white; font-family: monospace; padding: 4px; }")
+        self.latency_overlay.move(8, 8)
+        self.latency_overlay.hide()
+        self.latency_toggle = QCheckBox("延迟叠加")
+        self.latency_toggle.toggled.connect(self.set_latency_overlay)
+
+        stats_layout = QHBoxLayout()
+        stats_layout.addWidget(self.video_stats, stretch=1)
+        stats_layout.addWidget(self.latency_toggle)
+
+        video_layout = QVBoxLayout()
+        video_layout.addWidget(self.video_view, stretch=1)
+        video_layout.addLayout(stats_layout)
 
         # 控制按钮区域
         self.init_control_buttons()
 
         # 主布局：左侧视频、右侧按钮
         main_layout = QHBoxLayout()
-        main_layout.addWidget(self.video_view, stretch=2)  # 视频区域伸展占比2
+        main_layout.addLayout(video_layout, stretch=2)  # 视频区域伸展占比2
         main_layout.addLayout(self.control_layout, stretch=1)  # 按钮区域占比1
 
         self.setLayout(main_layout)
@@ -200,33 +321,88 @@ class RobotControlUI(QWidget):
     def send_command(self, cmd):
         """发送命令到服务器"""
         if self.socket.state() == QTcpSocket.ConnectedState:
-            message = cmd + "\n"
-            self.socket.write(message.encode('utf-8'))
+            self.socket.write(command_line(cmd).encode('utf-8'))
             self.socket.flush()
         else:
             print(f"未连接到服务器，无法发送命令: {cmd}")
 
-    def update_video_frame(self, frame):
-        """更新视频流图像"""
-        image = QImage(frame.data, frame.shape[1], frame.shape[0], QImage.Format_RGB888).rgbSwapped()
-        pixmap = QPixmap.fromImage(image)
-        self.video_view.setPixmap(pixmap.scaled(self.video_view.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation))
+    def update_video_frame(self):
+        """更新视频流图像：只绘制最新一帧，缩放和颜色转换已在工作线程完成"""
+        frame = self.stream_thread.take_frame()
+        if frame is None:
+            return
+        try:
+            started = time.perf_counter()
+            image = QImage(frame.data, frame.shape[1], frame.shape[0], frame.strides[0], QImage.Format_RGB888)
+            self.video_view.setPixmap(QPixmap.fromImage(image))  # fromImage会复制数据，之后缓冲可归还
+        finally:
+            self.stream_thread.release_frame(frame)
+        self.record_paint_latency(time.perf_counter() - started)
+
+    def record_paint_latency(self, paint_time):
+        """记录绘制耗时，以及从帧到达（和源时间戳）到绘制完成的延迟"""
+        latency = self.stream_thread.latency
+        latency.observe('paint', paint_time)
+        if self.stream_thread.frame_info is None:
+            return
+        arrival, source = self.stream_thread.frame_info
+        now = time.time()
+        latency.observe('display', now - arrival)
+        if source is not None:
+            latency.observe('total', now - source)
+
+    def set_latency_overlay(self, enabled):
+        self.latency_overlay.setVisible(enabled)
+        if enabled:
+            self.update_latency_overlay()
+
+    def update_latency_overlay(self):
+        self.latency_overlay.setText(self.stream_thread.latency.overlay_text(OVERLAY_STAGES, '\n'))
+        self.latency_overlay.adjustSize()
+
+    def update_video_state(self, state):
+        """视频流中断时在画面区域显示提示，恢复后由下一帧覆盖"""
+        if state == STREAMING:
+            return
+        self.video_view.setPixmap(QPixmap())
+        self.video_view.setText(VIDEO_STATE_TEXT.get(state, state))
+
+    def update_video_stats(self):
+        """显示视频流状态和解码/渲染/丢弃帧数"""
+        thread = self.stream_thread
+        stream = thread.stream
+        state, reconnects = (stream.state, stream.reconnects) if stream else (CONNECTING, 0)
+        self.video_stats.setText(f"{VIDEO_STATE_TEXT.get(state, state)}  "
+                                 f"重连 {reconnects}  解码 {thread.frames_decoded}  "
+                                 f"渲染 {thread.frames_rendered}  丢弃 {thread.frames_dropped}")
+        if self.latency_overlay.isVisible():
+            self.update_latency_overlay()
+
+    def resizeEvent(self, event):
+        """窗口尺寸变化时通知视频线程按新尺寸缩放"""
+        super().resizeEvent(event)
+        self.stream_thread.set_target_size(self.video_view.width(), self.video_view.height())
 
     def closeEvent(self, event):
         """窗口关闭时停止视频流线程"""
         self.stream_thread.stop()
         event.accept()
 
-if __name__ == "__main__":
+def main():
     app = QApplication(sys.argv)
 
-    # 服务器配置：替换为实际IP和端口
-    SERVER_IP = "192.168.2.34"  # 服务器IP地址
-    SERVER_PORT = 8082          # 机器人控制端口
-    VIDEO_PORT = 8080           # 视频流端口
+    # 机器人配置：可用环境变量覆盖
+    server_ip = os.environ.get('ROBOT_IP', "192.168.2.34")     # 机器人IP地址
+    server_port = int(os.environ.get('ROBOT_PORT', 8082))       # 机器人控制端口
+    video_port = int(os.environ.get('ROBOT_VIDEO_PORT', 8080))  # 视频流端口
 
-    # 启动应用
-    window = RobotControlUI(SERVER_IP, SERVER_PORT, VIDEO_PORT)
+    # 先显示窗口，事件循环开始后立即连接机器人并在后台加载视频
+    window = RobotControlUI(server_ip, server_port, video_port)
     window.show()
+    QTimer.singleShot(0, window.start)
 
-    sys.exit(app.exec_())
\ No newline at end of file
+    return app.exec_()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,282 @@
+import bisect
+import threading
+import time
+
+# 关闭后所有埋点退化为一次布尔判断
+enabled = True
+
+# 延迟直方图的桶上界（秒）：0.05ms 到 10s，大致按 1-2.5-5 递增
+LATENCY_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+def enable(value=True):
+    global enabled
+    enabled = bool(value)
+
+
+def _format_labels(labels, extra=None):
+    items = list(labels.items()) + list((extra or {}).items())
+    if not items:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in items) + '}'
+
+
+def _bucket_quantile(buckets, counts, total, q):
+    if not total:
+        return None
+    rank = q * total
+    seen = 0
+    for index, count in enumerate(counts):
+        if count and seen + count >= rank:
+            lower = buckets[index - 1] if index else 0.0
+            upper = buckets[index] if index < len(buckets) else buckets[-1]
+            return lower + (upper - lower) * (rank - seen) / count
+        seen += count
+    return buckets[-1]
+
+
+class Histogram:
+    """固定桶直方图：内存占用固定，分位数由桶边界线性插值估算"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # 最后一个桶为 +Inf
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def quantile(self, q):
+        """估算分位数，没有样本时返回 None"""
+        with self._lock:
+            counts = list(self.counts)
+            total = self.count
+        return _bucket_quantile(self.buckets, counts, total, q)
+
+    def render(self, name, labels):
+        """返回 (本指标的样本行, {附加仪表后缀: 样本行})"""
+        with self._lock:
+            counts = list(self.counts)
+            total, value_sum = self.count, self.sum
+        lines = []
+        quantiles = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append(f'{name}_bucket{_format_labels(labels, {"le": le})} {cumulative}')
+        lines.append(f'{name}_sum{_format_labels(labels)} {value_sum:.6f}')
+        lines.append(f'{name}_count{_format_labels(labels)} {total}')
+        for q in (0.5, 0.95, 0.99):
+            value = self.quantile(q)
+            if value is not None:
+                quantiles.append(f'{name}_quantile{_format_labels(labels, {"quantile": q})} {value:.6f}')
+        return lines, {'_quantile': quantiles}
+
+
+class RollingHistogram:
+    """只统计最近 window 秒的直方图：窗口分成 slots 个时间片轮换，过期的时间片整体清零"""
+
+    def __init__(self, window=10.0, slots=5, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.window = window
+        self.slot_length = window / slots
+        self._slot_ids = [None] * slots
+        self._slots = [[0] * (len(self.buckets) + 1) for _ in range(slots)]
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        slot_id = int(time.monotonic() / self.slot_length)
+        index = slot_id % len(self._slots)
+        bucket = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            if self._slot_ids[index] != slot_id:
+                self._slot_ids[index] = slot_id
+                self._slots[index] = [0] * (len(self.buckets) + 1)
+            self._slots[index][bucket] += 1
+
+    def _merged(self):
+        oldest = int(time.monotonic() / self.slot_length) - len(self._slots) + 1
+        counts = [0] * (len(self.buckets) + 1)
+        with self._lock:
+            for slot_id, slot in zip(self._slot_ids, self._slots):
+                if slot_id is not None and slot_id >= oldest:
+                    counts = [a + b for a, b in zip(counts, slot)]
+        return counts
+
+    def count(self):
+        """窗口内的样本数"""
+        return sum(self._merged())
+
+    def quantiles(self, qs=(0.5, 0.95, 0.99)):
+        """一次合并窗口，返回 {q: 估算值}；没有样本时值为 None"""
+        return self.snapshot(qs)[1]
+
+    def snapshot(self, qs=(0.5, 0.95, 0.99)):
+        """一次合并窗口，返回 (样本数, {q: 估算值})；两者来自同一份数据，不会因窗口轮换而不一致"""
+        counts = self._merged()
+        total = sum(counts)
+        return total, {q: _bucket_quantile(self.buckets, counts, total, q) for q in qs}
+
+
+class Counter:
+    """单调计数器，附带最近一分钟的平均速率（60个一秒槽位的环形缓冲）"""
+
+    WINDOW = 60
+
+    def __init__(self):
+        self.value = 0
+        self._slots = [0] * self.WINDOW
+        self._slot_time = [0] * self.WINDOW
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        second = int(time.monotonic())
+        index = second % self.WINDOW
+        with self._lock:
+            self.value += amount
+            if self._slot_time[index] != second:
+                self._slot_time[index] = second
+                self._slots[index] = 0
+            self._slots[index] += amount
+
+    def rate(self):
+        """最近一分钟的每秒平均值"""
+        now = int(time.monotonic())
+        with self._lock:
+            total = sum(count for count, second in zip(self._slots, self._slot_time)
+                        if now - second < self.WINDOW)
+        return total / self.WINDOW
+
+    def render(self, name, labels):
+        return ([f'{name}_total{_format_labels(labels)} {self.value}'],
+                {'_rate1m': [f'{name}_rate1m{_format_labels(labels)} {self.rate():.3f}']})
+
+
+class Registry:
+    """指标注册表，按 Prometheus 文本格式输出"""
+
+    def __init__(self):
+        self._families = {}  # name -> (类型, 说明, {标签元组: 指标})
+        self._gauges = {}    # name -> (说明, 回调)
+        self._lock = threading.Lock()
+
+    def _get(self, kind, factory, name, help_text, labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            family = self._families.setdefault(name, (kind, help_text, {}))
+            metric = family[2].get(key)
+            if metric is None:
+                metric = family[2][key] = factory()
+            return metric
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS, **labels):
+        return self._get('histogram', lambda: Histogram(buckets), name, help_text, labels)
+
+    def counter(self, name, help_text, **labels):
+        return self._get('counter', Counter, name, help_text, labels)
+
+    def gauge(self, name, help_text, callback):
+        """注册在输出时才取值的仪表，callback 返回数值或 {标签字典元组: 数值}"""
+        with self._lock:
+            self._gauges[name] = (help_text, callback)
+
+    def render(self):
+        with self._lock:
+            families = [(name, kind, help_text, list(metrics.items()))
+                        for name, (kind, help_text, metrics) in self._families.items()]
+            gauges = list(self._gauges.items())
+        lines = []
+        for name, kind, help_text, metrics in families:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            extras = {}
+            for key, metric in metrics:
+                samples, extra = metric.render(name, dict(key))
+                lines.extend(samples)
+                for suffix, extra_lines in extra.items():
+                    extras.setdefault(suffix, []).extend(extra_lines)
+            # 分位数和速率作为独立的 gauge 指标输出
+            for suffix, extra_lines in extras.items():
+                if extra_lines:
+                    lines.append(f'# TYPE {name}{suffix} gauge')
+                    lines.extend(extra_lines)
+        for name, (help_text, callback) in gauges:
+            try:
+                value = callback()
+            except Exception:
+                continue
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} gauge')
+            if isinstance(value, dict):
+                for labels, item in value.items():
+                    lines.append(f'{name}{_format_labels(dict(labels))} {item}')
+            else:
+                lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+class _NullTrace:
+    """关闭埋点时使用的空实现"""
+
+    def mark(self, stage):
+        pass
+
+    def finish(self, result=None):
+        pass
+
+
+NULL_TRACE = _NullTrace()
+
+
+class Trace:
+    """一次处理过程的分阶段计时：每次 mark 记录距上一次 mark 的耗时
+
+    各阶段耗时记入直方图 <name>_stage_seconds{stage=...}，finish 时记录总耗时并计入 <name>{result=...}。
+    """
+
+    def __init__(self, name, **labels):
+        self.name = name
+        self.labels = labels
+        self.start = self.last = time.perf_counter()
+
+    def mark(self, stage):
+        now = time.perf_counter()
+        registry.histogram(f'{self.name}_stage_seconds', 'Per-stage latency in seconds',
+                           stage=stage, **self.labels).observe(now - self.last)
+        self.last = now
+
+    def finish(self, result='ok'):
+        """记录总耗时并按结果计数"""
+        registry.histogram(f'{self.name}_stage_seconds', 'Per-stage latency in seconds',
+                           stage='total', **self.labels).observe(time.perf_counter() - self.start)
+        registry.counter(self.name, 'Processed count', result=result, **self.labels).inc()
+
+
+def trace(name, **labels):
+    """开始一次计时；埋点关闭时返回空实现"""
+    if not enabled:
+        return NULL_TRACE
+    return Trace(name, **labels)
+
+
+def observe(name, value, help_text='Latency in seconds', **labels):
+    """直接记录一个样本（秒）"""
+    if enabled:
+        registry.histogram(name, help_text, **labels).observe(value)
+
+
+def render():
+    return registry.render()
@@ -0,0 +1,260 @@
+import re
+
+# 每次从socket读取的最大字节数；读取使用 read1 语义，有多少取多少，不会为凑满而等待
+DEFAULT_CHUNK_SIZE = 64 * 1024
+# 单帧上限，超过视为流已损坏并重新同步
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+# 找不到SOI时最多保留的字节数（用于保留尚未结束的 multipart 分段头）
+MAX_HEADER_SIZE = 64 * 1024
+
+SOI = b'\xff\xd8'
+MULTIPART_BOUNDARY = b'frame'
+# 熵编码数据中的真实标记：0xFF 后面不是填充 0x00、RSTn 或另一个 0xFF
+_MARKER = re.compile(rb'\xff[^\x00\xd0-\xd7\xff]')
+_CONTENT_LENGTH = re.compile(rb'content-length[ \t]*:[ \t]*(\d+)', re.IGNORECASE)
+_HEADER_END = b'\r\n\r\n'
+
+# 解析状态
+_SEEK, _LENGTH, _SEGMENTS, _ENTROPY = range(4)
+
+
+class MJPEGParser:
+    """增量式MJPEG流解析器
+
+    数据追加到可增长的 bytearray 中，每次从上次停下的位置继续扫描，整体为线性复杂度。
+    分段头带 Content-Length 且该位置正好是EOI时直接按长度切帧；否则按JPEG段结构遍历，
+    跳过各段负载（例如EXIF里缩略图自带的SOI/EOI），只在熵编码数据中寻找真正的EOI。
+    """
+
+    def __init__(self, max_frame_size=MAX_FRAME_SIZE):
+        self.max_frame_size = max_frame_size
+        self.frames = 0   # 已解析的完整帧数
+        self.resyncs = 0  # 因数据损坏而丢弃并重新同步的次数
+        self._buf = bytearray()
+        self._reset()
+
+    def _reset(self):
+        self._state = _SEEK
+        self._pos = 0     # 下次扫描的起点
+        self._start = 0   # 当前帧在缓冲区中的起点
+        self._length = 0  # Content-Length 给出的帧长度
+
+    @property
+    def buffered(self):
+        """缓冲区中尚未消费的字节数"""
+        return len(self._buf)
+
+    def feed(self, chunk):
+        """追加一段数据，返回其中已完整的JPEG帧列表"""
+        self._buf += chunk
+        frames = []
+        while True:
+            frame = self._next_frame()
+            if frame is None:
+                break
+            frames.append(frame)
+        return frames
+
+    def _emit(self, end):
+        frame = bytes(self._buf[self._start:end])
+        del self._buf[:end]
+        self._reset()
+        self.frames += 1
+        return frame
+
+    def _resync(self, pos):
+        """当前帧损坏，从 pos 开始重新寻找下一个SOI"""
+        self.resyncs += 1
+        self._state = _SEEK
+        self._pos = pos
+
+    def _content_length(self, soi):
+        """SOI 紧跟在 multipart 分段头之后时，返回头里的 Content-Length"""
+        header_end = self._buf.rfind(_HEADER_END, max(0, soi - MAX_HEADER_SIZE), soi)
+        if header_end == -1 or header_end + len(_HEADER_END) != soi:
+            return None
+        match = None
+        for match in _CONTENT_LENGTH.finditer(self._buf, max(0, header_end - 1024), header_end):
+            pass
+        if match is None:
+            return None
+        length = int(match.group(1))
+        if len(SOI) < length <= self.max_frame_size:
+            return length
+        return None
+
+    def _next_frame(self):
+        buf = self._buf
+        while True:
+            if self._state != _SEEK and len(buf) - self._start > self.max_frame_size:
+                self._resync(self._start + len(SOI))
+
+            if self._state == _SEEK:
+                soi = buf.find(SOI, self._pos)
+                if soi == -1:
+                    if len(buf) > MAX_HEADER_SIZE:
+                        del buf[:-1]
+                    # 最后一个字节可能是被截断的 0xFF，下次从这里接着找
+                    self._pos = max(len(buf) - 1, 0)
+                    return None
+                self._start = soi
+                length = self._content_length(soi)
+                if length:
+                    self._state = _LENGTH
+                    self._length = length
+                else:
+                    self._state = _SEGMENTS
+                    self._pos = soi + len(SOI)
+
+            elif self._state == _LENGTH:
+                end = self._start + self._length
+                if len(buf) < end:
+                    return None
+                if buf[end - 2:end] == b'\xff\xd9':
+                    return self._emit(end)
+                # Content-Length 与实际帧不符：不信任长度，从同一个SOI按段结构重新扫描
+                self.resyncs += 1
+                self._state = _SEGMENTS
+                self._pos = self._start + len(SOI)
+
+            elif self._state == _SEGMENTS:
+                i = self._pos
+                if len(buf) < i + 2:
+                    return None
+                if buf[i] != 0xFF:
+                    self._resync(self._start + len(SOI))
+                    continue
+                marker = buf[i + 1]
+                if marker == 0xFF:
+                    # 填充字节
+                    self._pos = i + 1
+                elif marker == 0xD9:
+                    return self._emit(i + 2)
+                elif marker == 0xD8:
+                    # 段结构中出现新的SOI：上一帧不完整，从新帧重新开始
+                    self.resyncs += 1
+                    self._start = i
+                    self._pos = i + 2
+                elif 0xD0 <= marker <= 0xD7 or marker == 0x01:
+                    # 无长度的独立标记
+                    self._pos = i + 2
+                else:
+                    if len(buf) < i + 4:
+                        return None
+                    segment_length = (buf[i + 2] << 8) | buf[i + 3]
+                    if segment_length < 2:
+                        self._resync(self._start + len(SOI))
+                        continue
+                    self._pos = i + 2 + segment_length
+                    if marker == 0xDA:
+                        self._state = _ENTROPY
+
+            else:  # _ENTROPY
+                if self._pos > len(buf):
+                    return None
+                match = _MARKER.search(buf, self._pos)
+                if match is None:
+                    self._pos = max(self._pos, len(buf) - 1)
+                    return None
+                # 遇到EOI或下一段（渐进式JPEG的后续扫描），回到段结构解析
+                self._pos = match.start()
+                self._state = _SEGMENTS
+
+
+def multipart_chunk(jpg):
+    """把一帧JPEG包装成 multipart/x-mixed-replace 的一个分段"""
+    return (b'--' + MULTIPART_BOUNDARY + b'\r\n'
+            b'Content-Type: image/jpeg\r\n'
+            b'Content-Length: ' + str(len(jpg)).encode('ascii') + b'\r\n\r\n' + jpg + b'\r\n')
+
+
+def iter_chunks(response, chunk_size=DEFAULT_CHUNK_SIZE):
+    """从 requests 的流式响应中读取数据块
+
+    优先使用 read1：有多少数据就返回多少，大块读取不会为凑满 chunk_size 而增加延迟。
+    """
+    raw = response.raw
+    read = getattr(raw, 'read1', None)
+    if read is None:
+        # 旧版 urllib3 没有 read1，退回到底层 http.client 响应
+        fp = getattr(raw, '_fp', None)
+        read = getattr(fp, 'read1', None) or raw.read
+    while True:
+        chunk = read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_frames(response, chunk_size=DEFAULT_CHUNK_SIZE, parser=None):
+    """逐帧产出流式响应中的完整JPEG字节"""
+    parser = parser or MJPEGParser()
+    for chunk in iter_chunks(response, chunk_size):
+        yield from parser.feed(chunk)
+
+
+# 帧头（SOFn）标记，C4/C8/CC 是 DHT/JPG/DAC，不是帧头
+_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def _segments(jpg):
+    """遍历SOS之前的JPEG段，产出 (标记, 负载)；负载是不复制的 memoryview，截断的段只产出已有部分
+
+    遇到SOS/EOI或数据损坏时结束，不进入熵编码数据。
+    """
+    data = memoryview(jpg)
+    i = len(SOI)
+    end = len(data)
+    while i + 4 <= end:
+        if data[i] != 0xFF:
+            return
+        marker = data[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        if 0xD0 <= marker <= 0xD7 or marker == 0x01:
+            i += 2
+            continue
+        if marker in (0xD9, 0xDA):
+            return
+        segment_length = (data[i + 2] << 8) | data[i + 3]
+        yield marker, data[i + 4:i + 2 + segment_length]
+        i += 2 + segment_length
+
+
+def jpeg_dimensions(jpg):
+    """只解析JPEG段头读取 (宽, 高)，不解码图像；找不到帧头时返回 None"""
+    for marker, payload in _segments(jpg):
+        if marker in _SOF_MARKERS:
+            if len(payload) < 5:
+                return None
+            height = (payload[1] << 8) | payload[2]
+            width = (payload[3] << 8) | payload[4]
+            return width, height
+    return None
+
+
+# COM 段负载上限（段长度字段为16位，包含自身2字节）
+MAX_COMMENT_SIZE = 0xFFFF - 2
+
+
+def add_comment(jpg, payload):
+    """在SOI之后插入一个COM段，不需要重新编码；解码器会忽略它"""
+    if len(payload) > MAX_COMMENT_SIZE:
+        raise ValueError(f"JPEG comment too long: {len(payload)} bytes")
+    return jpg[:len(SOI)] + b'\xff\xfe' + (len(payload) + 2).to_bytes(2, 'big') + payload + jpg[len(SOI):]
+
+
+# 帧时间戳注释的前缀，负载为 "ts=<Unix时间>"（由模拟器或支持的摄像头写入）
+TIMESTAMP_PREFIX = b'ts='
+
+
+def frame_timestamp(jpg):
+    """读取SOS之前COM段中的 "ts=<Unix时间>"，没有时返回 None；只扫描段头"""
+    for marker, payload in _segments(jpg):
+        if marker == 0xFE and payload[:len(TIMESTAMP_PREFIX)] == TIMESTAMP_PREFIX:
+            try:
+                return float(bytes(payload[len(TIMESTAMP_PREFIX):]))
+            except ValueError:
+                return None
+    return None
@@ -0,0 +1,214 @@
+import bisect
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+
+# 每条记录：魔数 + 时间戳(float64) + 长度(uint32)，之后是原始JPEG字节
+RECORD_MAGIC = b'FR'
+RECORD_HEADER = struct.Struct('<2sdI')
+
+
+class Segment:
+    """一个固定大小、内存映射的分段文件，附带 时间戳 -> 偏移 的紧凑索引"""
+
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        self.generation = 0  # 每次被覆盖重用时递增，读取方据此发现数据已失效
+        self.timestamps = array('d')
+        self.offsets = array('Q')
+        self.write_pos = 0
+
+        with open(path, 'a+b') as f:
+            f.truncate(size)
+        self._file = open(path, 'r+b')
+        self.map = mmap.mmap(self._file.fileno(), size)
+
+    @property
+    def first_time(self):
+        return self.timestamps[0] if self.timestamps else None
+
+    @property
+    def last_time(self):
+        return self.timestamps[-1] if self.timestamps else None
+
+    def scan(self):
+        """启动时从已有文件重建索引"""
+        pos = 0
+        while pos + RECORD_HEADER.size <= self.size:
+            magic, timestamp, length = RECORD_HEADER.unpack_from(self.map, pos)
+            end = pos + RECORD_HEADER.size + length
+            if magic != RECORD_MAGIC or end > self.size:
+                break
+            self.timestamps.append(timestamp)
+            self.offsets.append(pos)
+            pos = end
+        self.write_pos = pos
+
+    def reset(self):
+        """清空分段以便重用"""
+        self.generation += 1
+        self.timestamps = array('d')
+        self.offsets = array('Q')
+        self.write_pos = 0
+        self.map[0:RECORD_HEADER.size] = bytes(RECORD_HEADER.size)
+
+    def fits(self, length):
+        return self.write_pos + RECORD_HEADER.size + length + RECORD_HEADER.size <= self.size
+
+    def append(self, timestamp, jpg):
+        pos = self.write_pos
+        start = pos + RECORD_HEADER.size
+        self.map[start:start + len(jpg)] = jpg
+        # 先写数据再写头，读取方看到魔数时数据一定已完整
+        end = start + len(jpg)
+        self.map[end:end + RECORD_HEADER.size] = bytes(RECORD_HEADER.size)
+        RECORD_HEADER.pack_into(self.map, pos, RECORD_MAGIC, timestamp, len(jpg))
+        self.write_pos = end
+        return pos
+
+    def read(self, offset):
+        _, timestamp, length = RECORD_HEADER.unpack_from(self.map, offset)
+        start = offset + RECORD_HEADER.size
+        return timestamp, self.map[start:start + length]
+
+    def close(self):
+        self.map.close()
+        self._file.close()
+
+
+class FrameRecorder:
+    """摄像头画面的环形录像
+
+    作为视频广播器的一个普通订阅者在后台线程中写入，不在直播路径上增加任何工作；
+    落后时和其他客户端一样跳过旧帧。原始JPEG不重新编码，追加到固定大小的内存映射分段文件，
+    分段写满后覆盖最旧的分段，因此磁盘和内存占用都有上限。
+    """
+
+    def __init__(self, hub, directory, segment_size=64 * 1024 * 1024, max_segments=16, retry_delay=1.0):
+        self.hub = hub
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+        self.retry_delay = retry_delay
+
+        self._lock = threading.Lock()
+        self._segments = []  # 按时间从旧到新排列
+        self._current = None
+        self._running = False
+        self._thread = None
+        self._cursor = None
+
+        self.frames_written = 0
+        self.frames_skipped = 0  # 超过分段大小无法写入的帧
+
+    def start(self):
+        """加载已有分段并启动录像线程"""
+        if self._running:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._load_segments()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="frame-recorder", daemon=True)
+        self._thread.start()
+        logging.info(f"Recording camera stream to {self.directory} "
+                     f"({self.max_segments} x {self.segment_size // (1024 * 1024)} MB)")
+
+    def stop(self):
+        self._running = False
+        if self._cursor:
+            self._cursor.close()
+        if self._thread:
+            self._thread.join(timeout=2)
+        with self._lock:
+            for segment in self._segments:
+                segment.close()
+            self._segments = []
+            self._current = None
+
+    def _segment_path(self, index):
+        return os.path.join(self.directory, f"segment-{index:03d}.mjr")
+
+    def _load_segments(self):
+        segments = []
+        for index in range(self.max_segments):
+            segment = Segment(self._segment_path(index), self.segment_size)
+            segment.scan()
+            segments.append(segment)
+        # 空分段排在最前面，优先被使用；其余按时间排序
+        segments.sort(key=lambda s: (s.first_time is not None, s.first_time or 0))
+        with self._lock:
+            self._segments = segments
+            recorded = [s for s in segments if s.timestamps]
+            self._current = recorded[-1] if recorded else segments[0]
+            if recorded:
+                # 当前分段要排在最后
+                self._segments.remove(self._current)
+                self._segments.append(self._current)
+
+    def _run(self):
+        while self._running:
+            self._cursor = self.hub.subscribe()
+            for jpg in self._cursor:
+                if not self._running:
+                    break
+                # 以帧到达解析器的时间记录，回放间隔和按时间查找不包含录像线程的延迟
+                self.write(self._cursor.frame_time, jpg)
+            self._cursor.close()
+            if self._running:
+                time.sleep(self.retry_delay)
+
+    def write(self, timestamp, jpg):
+        """追加一帧；当前分段已满时覆盖最旧的分段"""
+        if RECORD_HEADER.size * 2 + len(jpg) > self.segment_size:
+            self.frames_skipped += 1
+            return
+        with self._lock:
+            if not self._current.fits(len(jpg)):
+                oldest = self._segments.pop(0)
+                oldest.reset()
+                self._segments.append(oldest)
+                self._current = oldest
+            segment = self._current
+            offset = segment.append(timestamp, jpg)
+            segment.timestamps.append(timestamp)
+            segment.offsets.append(offset)
+        self.frames_written += 1
+
+    def frames(self, start, end=None):
+        """按时间顺序产出 [start, end] 内的 (时间戳, JPEG字节)
+
+        读取时不长期持有锁；如果分段在读取过程中被覆盖，则跳到后续分段继续。
+        """
+        end = end if end is not None else float('inf')
+        with self._lock:
+            segments = [(s, s.generation) for s in self._segments if s.timestamps and s.last_time >= start]
+        for segment, generation in segments:
+            index = bisect.bisect_left(segment.timestamps, start)
+            while True:
+                with self._lock:
+                    if segment.generation != generation or index >= len(segment.timestamps):
+                        break
+                    timestamp = segment.timestamps[index]
+                    if timestamp > end:
+                        return
+                    _, jpg = segment.read(segment.offsets[index])
+                yield timestamp, jpg
+                index += 1
+
+    def stats(self):
+        with self._lock:
+            recorded = [s for s in self._segments if s.timestamps]
+            return {
+                'segments': len(recorded),
+                'max_segments': self.max_segments,
+                'oldest': recorded[0].first_time if recorded else None,
+                'newest': recorded[-1].last_time if recorded else None,
+                'frames': sum(len(s.timestamps) for s in recorded),
+                'frames_written': self.frames_written,
+                'frames_skipped': self.frames_skipped,
+            }
@@ -0,0 +1,388 @@
+import errno
+import heapq
+import itertools
+import logging
+import random
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+from command_scheduler import CommandScheduler
+from core import command_line
+import metrics
+
+# 连接状态
+DISCONNECTED = 'disconnected'
+CONNECTING = 'connecting'
+CONNECTED = 'connected'
+
+
+class IOLoop:
+    """基于 selectors 的单线程I/O循环，所有 socket 读写都在这个线程里完成
+
+    其他线程通过 call_soon/call_later 提交回调，提交后会唤醒 select。
+    一个循环可以同时承载多个连接。
+    """
+
+    def __init__(self, name="robot-io"):
+        self.name = name
+        self._selector = selectors.DefaultSelector()
+        self._lock = threading.Lock()
+        self._calls = deque()
+        self._timers = []
+        self._timer_seq = itertools.count()
+        self._thread = None
+        self._running = False
+
+        # 自唤醒管道：跨线程提交回调时写入一个字节打断 select
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ, self._drain_wakeup)
+
+    def start(self):
+        """启动I/O线程（重复调用无副作用）"""
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """停止I/O线程"""
+        with self._lock:
+            self._running = False
+        self._wakeup()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2)
+
+    def in_loop(self):
+        return threading.current_thread() is self._thread
+
+    def call_soon(self, callback):
+        """在I/O线程中尽快执行回调（线程安全）"""
+        with self._lock:
+            self._calls.append(callback)
+        self._wakeup()
+
+    def call_later(self, delay, callback):
+        """delay 秒后在I/O线程中执行回调（线程安全）"""
+        with self._lock:
+            heapq.heappush(self._timers, (time.monotonic() + delay, next(self._timer_seq), callback))
+        self._wakeup()
+
+    def register(self, sock, events, callback):
+        self._selector.register(sock, events, callback)
+
+    def modify(self, sock, events, callback):
+        self._selector.modify(sock, events, callback)
+
+    def unregister(self, sock):
+        try:
+            self._selector.unregister(sock)
+        except (KeyError, ValueError):
+            pass
+
+    def _wakeup(self):
+        try:
+            self._wake_w.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass  # 管道已满说明已有待处理的唤醒
+
+    def _drain_wakeup(self, mask):
+        try:
+            while self._wake_r.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._running:
+                    return
+                calls, self._calls = self._calls, deque()
+                now = time.monotonic()
+                while self._timers and self._timers[0][0] <= now:
+                    calls.append(heapq.heappop(self._timers)[2])
+                timeout = max(0.0, self._timers[0][0] - now) if self._timers else None
+
+            for callback in calls:
+                self._invoke(callback)
+            if calls:
+                # 回调可能提交了新的任务，先不阻塞
+                timeout = 0
+
+            for key, mask in self._selector.select(timeout):
+                self._invoke(key.data, mask)
+
+    def _invoke(self, callback, *args):
+        try:
+            callback(*args)
+        except Exception:
+            logging.exception(f"Unhandled error in {self.name} loop")
+
+
+_default_loop = None
+_default_loop_lock = threading.Lock()
+
+
+def default_loop():
+    """进程共享的I/O循环"""
+    global _default_loop
+    with _default_loop_lock:
+        if _default_loop is None:
+            _default_loop = IOLoop()
+        _default_loop.start()
+        return _default_loop
+
+
+class RobotLink:
+    """机器人TCP连接管理器
+
+    socket 只在I/O线程中读写：请求线程调用 send() 只是把命令放入有界队列，不会阻塞。
+    I/O线程把排队的命令合并成一次写入，关闭 Nagle 算法，持续读取并丢弃机器人的回复，
+    连接断开后按指数退避（带随机抖动）自动重连。
+    """
+
+    def __init__(self, host, port, loop=None, max_queue=64, connect_timeout=5.0,
+                 backoff_initial=0.2, backoff_max=5.0, on_state_change=None, scheduler=None, metric_labels=None):
+        self.host = host
+        self.port = port
+        self.loop = loop or default_loop()
+        self.scheduler = scheduler if scheduler is not None else CommandScheduler(max_queue=max_queue)
+        self.connect_timeout = connect_timeout
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.on_state_change = on_state_change  # 回调 on_state_change(state)，在I/O线程中调用
+        self.metric_labels = metric_labels or {}  # 写入 /api/metrics 时附加的标签，例如 robot=<id>
+
+        self.state = DISCONNECTED
+        self._state_cond = threading.Condition()
+        self._enabled = False  # 用户要求保持连接；为 False 时不自动重连
+        self._sock = None
+        self._connect_deadline = None
+        self._backoff = backoff_initial
+
+        self._lock = threading.Lock()
+        self._flush_scheduled = False
+        self._outbuf = bytearray()  # 已合并但尚未写完的数据，只在I/O线程访问
+        self._queued_since = None   # 当前排队中最早一条命令的入队时间（仅在开启埋点时记录）
+        self._writing_since = None  # 发送缓冲中最早一条命令的入队时间
+
+        # 统计
+        self.commands_sent = 0
+        self.commands_dropped = 0
+        self.writes = 0
+        self.reconnects = 0
+        self.last_reply = None
+        self.last_error = None
+
+    @property
+    def connected(self):
+        return self.state == CONNECTED
+
+    # ---- 请求线程调用的接口 ----
+
+    def connect(self, wait=None):
+        """开始连接（之后断线会自动重连），wait 不为空时最多等待这么多秒，返回是否已连接"""
+        self._enabled = True
+        with self._state_cond:
+            if self.state == DISCONNECTED:
+                # 立即进入连接中状态，wait_connected 才能等到本轮结果
+                self.state = CONNECTING
+        self.loop.call_soon(self._start_connect)
+        if wait is not None:
+            return self.wait_connected(wait)
+        return self.connected
+
+    def disconnect(self):
+        """主动断开，不再重连；已排队的命令（例如停止）会先尽量写出"""
+        self._enabled = False
+        self.loop.call_soon(self._shutdown)
+
+    def wait_connected(self, timeout):
+        """等待连接成功或本轮连接失败"""
+        with self._state_cond:
+            self._state_cond.wait_for(lambda: self.state != CONNECTING, timeout)
+            return self.state == CONNECTED
+
+    def wait_disconnected(self, timeout):
+        """等待 disconnect() 写完已排队的命令并关闭socket"""
+        with self._state_cond:
+            return self._state_cond.wait_for(lambda: self.state == DISCONNECTED, timeout)
+
+    def send(self, command):
+        """把一条命令交给调度器排队，未连接或队列已满时返回 False"""
+        if not self.connected:
+            return False
+        command = command_line(command)
+        accepted, urgent = self.scheduler.offer(command)
+        if not accepted:
+            self.commands_dropped += 1
+            return False
+        with self._lock:
+            if metrics.enabled and self._queued_since is None:
+                self._queued_since = time.perf_counter()
+            schedule = urgent or not self._flush_scheduled
+            self._flush_scheduled = True
+        if schedule:
+            self.loop.call_soon(self._flush)
+        return True
+
+    def stats(self):
+        return {
+            'state': self.state,
+            'queued': len(self.scheduler),
+            'commands_sent': self.commands_sent,
+            'commands_dropped': self.commands_dropped,
+            'writes': self.writes,
+            'reconnects': self.reconnects,
+            'last_error': self.last_error,
+            **self.scheduler.stats(),
+        }
+
+    # ---- 以下只在I/O线程中执行 ----
+
+    def _set_state(self, state):
+        with self._state_cond:
+            changed = self.state != state
+            self.state = state
+            self._state_cond.notify_all()
+        if not changed:
+            return
+        logging.info(f"Robot link {self.host}:{self.port} {state}")
+        if self.on_state_change:
+            self.on_state_change(state)
+
+    def _start_connect(self):
+        if not self._enabled or self._sock is not None:
+            return
+        self._set_state(CONNECTING)
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            sock.setblocking(False)
+        except OSError as e:
+            self._fail(f"Failed to create socket: {e}")
+            return
+
+        self._sock = sock
+        err = sock.connect_ex((self.host, self.port))
+        if err not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY):
+            self._fail(f"Connect failed: {errno.errorcode.get(err, err)}")
+            return
+        self.loop.register(sock, selectors.EVENT_WRITE, self._on_connect_ready)
+        deadline = self._connect_deadline = object()
+        self.loop.call_later(self.connect_timeout, lambda: self._on_connect_timeout(sock, deadline))
+
+    def _on_connect_timeout(self, sock, deadline):
+        if self._sock is sock and self.state == CONNECTING and self._connect_deadline is deadline:
+            self._fail("Connection attempt timed out")
+
+    def _on_connect_ready(self, mask):
+        err = self._sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if err:
+            self._fail(f"Connect failed: {errno.errorcode.get(err, err)}")
+            return
+        self._backoff = self.backoff_initial
+        self._outbuf.clear()
+        self.scheduler.clear()  # 断线期间的运动命令已过时，不补发
+        self.loop.modify(self._sock, selectors.EVENT_READ, self._on_event)
+        self._set_state(CONNECTED)
+
+    def _on_event(self, mask):
+        if mask & selectors.EVENT_READ:
+            self._read_replies()
+        if self._sock is not None and mask & selectors.EVENT_WRITE:
+            self._write()
+
+    def _read_replies(self):
+        """读取并丢弃机器人的回复，避免对端发送缓冲被填满"""
+        try:
+            data = self._sock.recv(4096)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            self._fail(f"Receive error: {e}")
+            return
+        if not data:
+            self._fail("Connection closed by robot")
+            return
+        lines = data.strip().splitlines()
+        if lines:
+            self.last_reply = lines[-1].decode('utf-8', 'replace')
+            logging.debug(f"Robot reply: {self.last_reply}")
+
+    def _flush(self):
+        """把队列中的命令合并进发送缓冲并尝试写出"""
+        with self._lock:
+            self._flush_scheduled = False
+            queued_since, self._queued_since = self._queued_since, None
+        if queued_since is not None and self._writing_since is None:
+            self._writing_since = queued_since
+        pending, urgent = self.scheduler.drain()
+        if self.state != CONNECTED or not pending:
+            return
+        if urgent:
+            # 紧急命令插队：只保留可能已写出一部分的第一行，其余尚未写出的普通命令丢弃
+            end = self._outbuf.find(b'\n')
+            if end != -1:
+                del self._outbuf[end + 1:]
+        for command in pending:
+            self._outbuf += command.encode('utf-8')
+        self.commands_sent += len(pending)
+        self._write()
+
+    def _write(self):
+        if not self._outbuf:
+            return
+        try:
+            sent = self._sock.send(self._outbuf)
+            self.writes += 1
+        except (BlockingIOError, InterruptedError):
+            sent = 0
+        except OSError as e:
+            self._fail(f"Send error: {e}")
+            return
+        del self._outbuf[:sent]
+        if not self._outbuf and self._writing_since is not None:
+            metrics.observe('robot_link_queue_to_write_seconds', time.perf_counter() - self._writing_since,
+                            'Command enqueue to socket write completion, seconds', **self.metric_labels)
+            self._writing_since = None
+        # 没写完就等待可写事件，写完后只关注读事件
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if self._outbuf else 0)
+        self.loop.modify(self._sock, events, self._on_event)
+
+    def _shutdown(self):
+        if self._sock is not None and self.state == CONNECTED:
+            self._flush()
+        self.scheduler.clear()
+        self._close(DISCONNECTED)
+
+    def _close(self, state):
+        if self._sock is not None:
+            self.loop.unregister(self._sock)
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+            self._sock = None
+        self._outbuf.clear()
+        self._writing_since = None
+        self._set_state(state)
+
+    def _fail(self, message):
+        """连接出错：关闭socket，按退避时间安排重连"""
+        logging.error(f"Robot link {self.host}:{self.port}: {message}")
+        self.last_error = message
+        self._close(DISCONNECTED)
+        if self._enabled:
+            delay = self._backoff * random.uniform(0.5, 1.5)
+            self._backoff = min(self._backoff * 2, self.backoff_max)
+            self.reconnects += 1
+            logging.info(f"Reconnecting to robot in {delay:.2f}s")
+            self.loop.call_later(delay, self._start_connect)
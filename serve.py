@@ -0,0 +1,134 @@
+"""机器人控制服务的生产启动入口
+
+用法: python serve.py --robot-ip 192.168.2.34 [--listen 127.0.0.1:5000 --worker gevent]
+
+默认只监听本机：命令接口没有认证，需要从其他机器访问时显式指定 --listen 0.0.0.0:5000（或 LISTEN_HOST）。
+
+所有参数都可以用环境变量设置（见 --help），命令行参数优先。
+gevent 模式下每个 MJPEG/SSE/WebSocket 长连接只占一个协程，单进程可以同时服务数百个客户端；
+没有安装 gevent 时退回多线程服务器（每个长连接占一个线程）。
+收到 SIGINT/SIGTERM 时停止接受新连接，把已排队的停止命令写给机器人，关闭摄像头和机器人连接后退出。
+"""
+import argparse
+import os
+import sys
+
+WORKERS = ('gevent', 'threaded')
+
+
+def default_worker():
+    try:
+        import gevent  # noqa: F401
+    except ImportError:
+        return 'threaded'
+    return 'gevent'
+
+
+def parse_args(argv=None):
+    env = os.environ.get
+    parser = argparse.ArgumentParser(description='Robot control web server')
+    parser.add_argument('--robot-ip', default=env('ROBOT_IP'), help='robot address (ROBOT_IP)')
+    parser.add_argument('--robot-port', type=int, default=env('ROBOT_PORT'), help='robot command port (ROBOT_PORT)')
+    parser.add_argument('--video-port', type=int, default=env('ROBOT_VIDEO_PORT'),
+                        help='robot MJPEG camera port (ROBOT_VIDEO_PORT)')
+    parser.add_argument('--fleet', default=env('FLEET_CONFIG'),
+                        help='JSON file listing robots served under /robot/<id>/ (FLEET_CONFIG)')
+    parser.add_argument('--listen', default=f"{env('LISTEN_HOST', '127.0.0.1')}:{env('LISTEN_PORT', '5000')}",
+                        help='host:port to serve on (LISTEN_HOST, LISTEN_PORT)')
+    parser.add_argument('--worker', choices=WORKERS, default=env('SERVER_WORKER') or default_worker(),
+                        help='concurrency model (SERVER_WORKER); default gevent when installed')
+    parser.add_argument('--max-connections', type=int, default=int(env('SERVER_MAX_CONNECTIONS', 1000)),
+                        help='gevent: maximum concurrent connections (SERVER_MAX_CONNECTIONS)')
+    parser.add_argument('--record', action='store_true', default=None, help='enable ring-buffer recording')
+    parser.add_argument('--analytics', action='store_true', default=None,
+                        help='enable off-path motion/obstacle analytics (ANALYTICS_ENABLED)')
+    parser.add_argument('--grace', type=float, default=float(env('SERVER_SHUTDOWN_GRACE', 5)),
+                        help='seconds to let open streams finish on shutdown (SERVER_SHUTDOWN_GRACE)')
+    args = parser.parse_args(argv)
+
+    host, _, port = args.listen.rpartition(':')
+    if not host or not port.isdigit():
+        parser.error(f"--listen must be host:port, got {args.listen!r}")
+    args.host, args.port = host.strip('[]'), int(port)
+    return args
+
+
+def export_config(args):
+    """通过环境变量把配置交给 server 模块（模块导入时读取）"""
+    values = {
+        'ROBOT_IP': args.robot_ip,
+        'ROBOT_PORT': args.robot_port,
+        'ROBOT_VIDEO_PORT': args.video_port,
+        'FLEET_CONFIG': args.fleet,
+        'LISTEN_HOST': args.host,
+        'LISTEN_PORT': args.port,
+        'RECORDING_ENABLED': '1' if args.record else None,
+        'ANALYTICS_ENABLED': '1' if args.analytics else None,
+    }
+    for key, value in values.items():
+        if value is not None:
+            os.environ[key] = str(value)
+
+
+def serve_gevent(args):
+    # 必须在导入 server（以及其中的 socket/threading/requests）之前打补丁
+    from gevent import monkey
+    monkey.patch_all()
+
+    import logging
+    import signal
+    import gevent
+    from gevent.pywsgi import WSGIServer
+    import server
+
+    server.start()
+    http = WSGIServer((args.host, args.port), server.app, spawn=args.max_connections, log=None)
+
+    def stop():
+        logging.info("Stopping HTTP server")
+        http.close()  # 不再接受新连接
+        server.shutdown()  # 结束现有长连接的生成器
+        http.stop(timeout=args.grace)
+
+    gevent.signal_handler(signal.SIGTERM, lambda: gevent.spawn(stop))
+    gevent.signal_handler(signal.SIGINT, lambda: gevent.spawn(stop))
+    logging.info(f"Serving on http://{args.host}:{args.port} (gevent, max {args.max_connections} connections)")
+    http.serve_forever()
+
+
+def serve_threaded(args):
+    import logging
+    import signal
+    import threading
+    from werkzeug.serving import make_server
+    import server
+
+    http = make_server(args.host, args.port, server.app, threaded=True)
+    server.start()
+
+    def stop(signum, frame):
+        # shutdown() 会等待 serve_forever 返回，不能在主线程的信号处理函数里直接调用
+        threading.Thread(target=http.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    logging.info(f"Serving on http://{args.host}:{args.port} (threaded)")
+    try:
+        http.serve_forever()
+    finally:
+        server.shutdown()
+        http.server_close()
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    export_config(args)
+    if args.worker == 'gevent':
+        serve_gevent(args)
+    else:
+        serve_threaded(args)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
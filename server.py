@@ -1,15 +1,25 @@
-from flask import Flask, render_template, Response, jsonify, request
-import cv2
-import numpy as np
-import requests
-import threading
+from flask import Flask, render_template, Response, jsonify, request, abort
+import atexit
+import json
 import logging
-import socket
+import os
 import time
 import sys
-from datetime import datetime
+from datetime import datetime, timezone
+import metrics
+from robot_link import default_loop
+from mjpeg import multipart_chunk
+from video_profiles import VideoProfile, AdaptiveProfile
+from audit_log import AuditLog
+from fleet import Robot, Fleet, load_fleet_config
+
+try:
+    from flask_sock import Sock
+except ImportError:  # 未安装 flask-sock 时只提供 HTTP 命令接口
+    Sock = None
 
 app = Flask(__name__)
+sock = Sock(app) if Sock else None
 
 # 配置日志
 logging.basicConfig(
@@ -20,302 +30,514 @@ logging.basicConfig(
     ]
 )
 
-# Configuration
-SERVER_IP = "192.168.2.34"
-SERVER_PORT = 8082
-VIDEO_PORT = 8080
+# Configuration（可用环境变量覆盖，serve.py 的命令行参数也通过环境变量传入）
+SERVER_IP = os.environ.get('ROBOT_IP', "192.168.2.34")
+SERVER_PORT = int(os.environ.get('ROBOT_PORT', 8082))
+VIDEO_PORT = int(os.environ.get('ROBOT_VIDEO_PORT', 8080))
+
+# 车队配置：存在时按文件注册多台机器人（/robot/<id>/...），否则只有上面这一台，id 为 default
+FLEET_CONFIG = os.environ.get('FLEET_CONFIG', 'fleet.json')
+
+# 本服务监听的地址
+LISTEN_HOST = os.environ.get('LISTEN_HOST', '127.0.0.1')
+LISTEN_PORT = int(os.environ.get('LISTEN_PORT', 5000))
+
+# 视频转发：默认直接转发摄像头的原始JPEG，只有设置了缩放/质量/叠加时才解码重编码
+VIDEO_PASSTHROUGH = True
+VIDEO_RESIZE_WIDTH = None
+VIDEO_JPEG_QUALITY = None
+VIDEO_OVERLAY = False
+# 客户端可用 /video_feed?w=320&q=50&fps=10 选择配置；写出阻塞时自动降档
+VIDEO_ADAPTIVE = True
+VIDEO_PROFILE_IDLE_TTL = 30
+# 上游摄像头：超过这么多秒没有完整帧就断开重连
+VIDEO_STALL_TIMEOUT = 2.0
+# 视频延迟统计的滚动窗口（秒），见 /api/video/latency；页面加 ?overlay=1 显示叠加层
+VIDEO_LATENCY_WINDOW = 10.0
+# /api/snapshot：没有观看者时自己打开上游，最多等待 SNAPSHOT_TIMEOUT 秒出画；
+# 最后一次请求后保持 SNAPSHOT_HOLD 秒，车队页面的轮询复用同一个上游连接
+SNAPSHOT_TIMEOUT = 3.0
+SNAPSHOT_HOLD = 10.0
+
+# 环形录像：把收到的原始JPEG写入固定大小的分段文件，写满后覆盖最旧的分段
+RECORDING_ENABLED = os.environ.get('RECORDING_ENABLED', '').lower() in ('1', 'true', 'yes')
+RECORDING_DIR = os.environ.get('RECORDING_DIR', 'recordings')
+RECORDING_SEGMENT_MB = 64
+RECORDING_SEGMENTS = 16
+
+# 旁路帧分析：按固定频率取样，在进程池中做运动检测和障碍线索，结果作为状态的 analytics 字段推送
+ANALYTICS_ENABLED = os.environ.get('ANALYTICS_ENABLED', '').lower() in ('1', 'true', 'yes')
+ANALYTICS_RATE_HZ = float(os.environ.get('ANALYTICS_RATE_HZ', 2))
+ANALYTICS_WORKERS = 2  # 每台机器人最多同时分析的帧数也是这个值，再多就跳过
+ANALYTICS_SIZE = (160, 120)
+ANALYTICS_MOTION_THRESHOLD = 25
+
+# 按住移动：服务器端重复发送的频率，以及多久没有心跳就自动停止
+HOLD_REPEAT_HZ = 10
+HOLD_DEADMAN_TIMEOUT = 1.5
+
+# 机器人连接：connect 命令最多等待的秒数、发送队列长度
+ROBOT_CONNECT_TIMEOUT = 5
+ROBOT_SEND_QUEUE = 64
+
+# 状态推送：增量合并窗口（秒）和空闲保活间隔（秒）
+STATUS_COALESCE = 0.2
+STATUS_KEEPALIVE = 15
+
+# 命令审计日志：后台线程写入追加式JSON行文件；重复的移动命令每 AUDIT_SAMPLE_EVERY 条记录一条
+AUDIT_LOG_FILE = os.environ.get('AUDIT_LOG_FILE', 'command_audit.jsonl') or None  # 空值表示只保留在内存中
+AUDIT_LOG_MAX_MB = 10  # 超过后轮转为 .1 .. .N
+AUDIT_LOG_BACKUPS = 5
+AUDIT_SAMPLE_EVERY = 10
+AUDIT_RING_SIZE = 500
+
+# 命令路径延迟埋点，关闭后只剩一次布尔判断
+METRICS_ENABLED = True
 
 # Global variables
-video_thread = None
-running = False
-bytes_data = b""
-robot_socket = None
-last_command_time = None
-connection_status = {
-    'connected': False,
-    'last_command': None,
-    'last_command_time': None,
-    'total_commands': 0,
-    'failed_commands': 0
-}
+BOOT_ID = f"{int(time.time()):x}"  # 帧序号在重启后从头开始，ETag 里带上启动标识避免冲突
+# 以下对象在导入时只构造不启动；后台线程、机器人连接等都在 start() 中创建
+audit_log = AuditLog(AUDIT_LOG_FILE, sample_every=AUDIT_SAMPLE_EVERY, capacity=AUDIT_RING_SIZE,
+                     max_bytes=AUDIT_LOG_MAX_MB * 1024 * 1024, backup_count=AUDIT_LOG_BACKUPS)
+io_loop = None  # 所有机器人的连接和按住重复节拍共用这一个I/O线程
+
+def create_robot(robot_id, host, port, video_port, name=None, recording_dir=RECORDING_DIR):
+    """按全局配置创建一台机器人"""
+    return Robot(robot_id, host, port, video_port, name, loop=io_loop,
+                 send_queue=ROBOT_SEND_QUEUE, connect_timeout=ROBOT_CONNECT_TIMEOUT,
+                 hold_rate_hz=HOLD_REPEAT_HZ, deadman_timeout=HOLD_DEADMAN_TIMEOUT,
+                 variant_idle_ttl=VIDEO_PROFILE_IDLE_TTL, video_stall_timeout=VIDEO_STALL_TIMEOUT,
+                 video_latency_window=VIDEO_LATENCY_WINDOW, recording_dir=recording_dir,
+                 recording_segment_size=RECORDING_SEGMENT_MB * 1024 * 1024,
+                 recording_segments=RECORDING_SEGMENTS)
+
+def load_fleet():
+    """按车队配置（没有时为单台默认机器人）创建机器人列表"""
+    specs = load_fleet_config(FLEET_CONFIG)
+    if specs is None:
+        return [create_robot('default', SERVER_IP, SERVER_PORT, VIDEO_PORT)]
+    logging.info(f"Loaded {len(specs)} robots from {FLEET_CONFIG}")
+    # 每台机器人的录像放在各自的子目录中
+    return [create_robot(recording_dir=os.path.join(RECORDING_DIR, spec['robot_id']), **spec) for spec in specs]
+
+fleet = Fleet()  # start() 中加载；路由和指标都引用这同一个注册表
+
+def get_robot(robot_id):
+    """路由中的机器人；不带 /robot/<id> 前缀时为默认机器人"""
+    robot = fleet.default if robot_id is None else fleet.get(robot_id)
+    if robot is None:
+        abort(404, description=f"Unknown robot: {robot_id}")
+    return robot
+
+def robot_route(rule, **options):
+    """同时注册默认机器人的路径和 /robot/<robot_id> 前缀的路径"""
+    def decorator(view):
+        app.route(rule, defaults={'robot_id': None}, **options)(view)
+        app.route(f'/robot/<robot_id>{rule}', **options)(view)
+        return view
+    return decorator
 
 def print_flush(*args, **kwargs):
     """立即打印并刷新输出"""
     print(*args, **kwargs)
     sys.stdout.flush()
 
-def update_status(command=None, success=True):
-    """更新状态信息"""
-    global connection_status
-    current_time = time.strftime('%H:%M:%S')
-    
-    if command:
-        connection_status['last_command'] = command
-        connection_status['last_command_time'] = current_time
-        connection_status['total_commands'] += 1
-        if not success:
-            connection_status['failed_commands'] += 1
-    
-    connection_status['connected'] = bool(robot_socket)
-    connection_status['current_time'] = current_time
-    
-    return connection_status
-
-def connect_to_robot():
-    """连接到机器人"""
-    global robot_socket
-    try:
-        logging.info(f"Attempting to connect to robot at {SERVER_IP}:{SERVER_PORT}")
-        
-        # 检查IP地址格式
-        try:
-            socket.inet_aton(SERVER_IP)
-        except socket.error:
-            logging.error(f"Invalid IP address format: {SERVER_IP}")
-            raise ValueError(f"Invalid IP address: {SERVER_IP}")
-
-        # 检查端口范围
-        if not (0 <= SERVER_PORT <= 65535):
-            logging.error(f"Invalid port number: {SERVER_PORT}")
-            raise ValueError(f"Port number must be between 0 and 65535")
-
-        # 创建socket
-        try:
-            robot_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            logging.info("Socket created successfully")
-        except socket.error as se:
-            logging.error(f"Failed to create socket: {str(se)}")
-            raise
-
-        # 设置socket选项
-        try:
-            robot_socket.settimeout(5)
-            # 设置keep-alive
-            robot_socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
-            # 设置非阻塞模式
-            robot_socket.setblocking(True)
-        except socket.error as se:
-            logging.error(f"Failed to set socket options: {str(se)}")
-            raise
-
-        # 尝试连接
-        try:
-            robot_socket.connect((SERVER_IP, SERVER_PORT))
-        except socket.timeout:
-            logging.error("Connection attempt timed out")
-            raise TimeoutError("Connection timed out - server may be down or unreachable")
-        except ConnectionRefusedError:
-            logging.error("Connection refused by server")
-            raise ConnectionRefusedError("Server actively refused connection - check if server is running and port is correct")
-        except PermissionError as pe:
-            logging.error(f"Permission denied: {str(pe)}")
-            raise PermissionError("Permission denied - try running as administrator")
-        except socket.gaierror as ge:
-            logging.error(f"Address-related error: {str(ge)}")
-            raise
-        except socket.error as se:
-            logging.error(f"Socket error during connect: {str(se)}")
-            raise
-
-        # 连接成功后的设置
-        robot_socket.settimeout(None)
-        logging.info("Successfully connected to robot")
-        
-        # 测试连接是否真正建立
-        try:
-            robot_socket.getpeername()
-            logging.info("Connection verified")
-        except socket.error:
-            logging.error("Connection verification failed")
-            raise ConnectionError("Connection appeared to succeed but verification failed")
-
-        update_status('connect', True)
-        return True
+def default_video_profile():
+    """由全局配置得到默认视频配置；关闭直通时至少按默认质量重新编码"""
+    quality = VIDEO_JPEG_QUALITY or (None if VIDEO_PASSTHROUGH else 90)
+    return VideoProfile(VIDEO_RESIZE_WIDTH, quality, None, VIDEO_OVERLAY)
 
-    except Exception as e:
-        logging.error(f"Connection failed: {str(e)}")
-        if robot_socket:
-            try:
-                robot_socket.close()
-                logging.info("Socket closed after error")
-            except Exception as close_error:
-                logging.error(f"Error while closing socket: {str(close_error)}")
-            finally:
-                robot_socket = None
-        
-        update_status('connect', False)
-        return False
-
-def send_robot_command(command):
-    """发送命令到机器人"""
-    global robot_socket
+def generate_frames(robot, profile=None):
+    """生成视频帧：同一配置的客户端共享编码结果，写出变慢时逐级降档"""
+    profile = profile or default_video_profile()
+    adaptive = AdaptiveProfile(profile) if VIDEO_ADAPTIVE else None
+    min_interval = 1.0 / profile.fps if profile.fps else 0
+    last_sent = 0.0
+    cursor = robot.video.subscribe(keepalive=True)  # 摄像头重连期间重发最后一帧
     try:
-        if not robot_socket:
-            logging.error("No connection to robot")
-            update_status(command, False)
-            return False
-
-        if not isinstance(command, str):
-            logging.error(f"Invalid command type: {type(command)}, expected string")
-            raise TypeError("Command must be a string")
-            
-        logging.info(f"Sending command: {command}")
-        
-        # 确保命令格式正确
-        if not command.strip():
-            logging.error("Empty command")
-            raise ValueError("Command cannot be empty")
-            
-        if not command.endswith('\n'):
-            command = command + '\n'
-        
-        # 尝试发送命令
-        try:
-            bytes_sent = robot_socket.sendall(command.encode('utf-8'))
-            logging.info(f"Command sent successfully: {command.strip()}")
-        except UnicodeEncodeError as ue:
-            logging.error(f"Command encoding error: {str(ue)}")
-            raise
-        except socket.timeout:
-            logging.error("Send timeout")
-            raise TimeoutError("Send operation timed out")
-        except ConnectionResetError:
-            logging.error("Connection reset by peer")
-            raise ConnectionResetError("Connection was reset - server may have closed connection")
-        except BrokenPipeError:
-            logging.error("Broken pipe")
-            raise BrokenPipeError("Connection broken - server may have closed connection")
-        except socket.error as se:
-            logging.error(f"Socket error while sending: {str(se)}")
-            raise
-
-        update_status(command, True)
-        return True
+        for jpg in cursor:
+            current = adaptive.current if adaptive else profile
+            now = time.monotonic()
+            if min_interval:
+                if now - last_sent < min_interval:
+                    continue
+                # 按节拍推进而不是从本次发送重新计时，否则源帧率不是整数倍时实际帧率偏低；
+                # 落后超过一个周期时不补发
+                last_sent = max(last_sent + min_interval, now - min_interval)
 
-    except Exception as e:
-        logging.error(f"Failed to send command: {str(e)}")
-        if robot_socket:
-            try:
-                robot_socket.close()
-                logging.info("Socket closed after send error")
-            except Exception as close_error:
-                logging.error(f"Error while closing socket: {str(close_error)}")
-            finally:
-                robot_socket = None
-        
-        update_status(command, False)
-        return False
-
-def generate_frames():
-    """生成视频帧"""
-    global bytes_data, running
-    running = True
-    video_url = f"http://{SERVER_IP}:{VIDEO_PORT}"
-    
-    try:
-        with requests.get(video_url, stream=True, timeout=5) as response:
-            if response.status_code == 200:
-                while running:
-                    chunk = response.raw.read(1024)
-                    if not chunk or not running:
-                        break
-                    
-                    bytes_data += chunk
-                    a = bytes_data.find(b'\xff\xd8')
-                    b = bytes_data.find(b'\xff\xd9')
-                    
-                    if a != -1 and b != -1:
-                        jpg = bytes_data[a:b+2]
-                        bytes_data = bytes_data[b+2:]
-                        frame = cv2.imdecode(np.frombuffer(jpg, dtype=np.uint8), cv2.IMREAD_COLOR)
-                        if frame is not None:
-                            ret, buffer = cv2.imencode('.jpg', frame)
-                            if ret:
-                                frame = buffer.tobytes()
-                                yield (b'--frame\r\n'
-                                      b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-    except Exception as e:
-        logging.error(f"Video stream error: {str(e)}")
+            jpg = robot.variants.get(cursor.last_seq, jpg, current)
+            if jpg is None:
+                continue
+            written_at = time.monotonic()
+            yield multipart_chunk(jpg)
+
+            # yield 返回时这一帧已写入socket，耗时反映客户端的接收能力
+            write_time = time.monotonic() - written_at
+            if adaptive and adaptive.record_write(write_time):
+                logging.info(f"Video client switched to profile {adaptive.current}")
+            if not cursor.repeated:
+                # 从到达解析器（以及源时间戳）到写完socket的延迟
+                now = time.time()
+                robot.latency.observe('write', write_time)
+                robot.latency.observe('deliver', now - cursor.frame_time)
+                if cursor.source_time is not None:
+                    robot.latency.observe('total', now - cursor.source_time)
     finally:
-        running = False
+        # 客户端断开时 Flask 会关闭生成器，这里释放游标
+        cursor.close()
+
+@robot_route('/')
+def index(robot_id):
+    """渲染主页；/robot/<id>/ 下的页面只控制这一台机器人"""
+    robot = get_robot(robot_id)
+    base = f"/robot/{robot.id}" if robot_id is not None else ''
+    return render_template('index.html', base=base, robot=robot)
 
-@app.route('/')
-def index():
-    """渲染主页"""
-    return render_template('index.html')
+@app.route('/fleet')
+def fleet_page():
+    """车队总览页面"""
+    return render_template('fleet.html')
 
-@app.route('/video_feed')
-def video_feed():
-    """视频流端点"""
-    return Response(generate_frames(),
+@app.route('/api/fleet', methods=['GET'])
+def fleet_status():
+    """所有机器人的连接和命令状态（读取各自缓存的快照）"""
+    return jsonify(fleet.summary())
+
+@robot_route('/video_feed')
+def video_feed(robot_id):
+    """视频流端点，可选查询参数 w（宽度）、q（JPEG质量）、fps（帧率上限）"""
+    robot = get_robot(robot_id)
+    profile = VideoProfile.from_args(request.args, default_video_profile())
+    return Response(generate_frames(robot, profile),
                    mimetype='multipart/x-mixed-replace; boundary=frame')
 
-@app.route('/api/status', methods=['GET'])
-def get_status():
+def parse_time_arg(value, default=None):
+    """解析时间参数：Unix时间戳（秒），负数表示距现在多少秒之前"""
+    if value is None or value == '':
+        return default
+    seconds = float(value)
+    return time.time() + seconds if seconds < 0 else seconds
+
+def generate_replay(robot, start, end, speed):
+    """按录制时的时间间隔（除以 speed）回放录像"""
+    previous = None
+    for timestamp, jpg in robot.recorder.frames(start, end):
+        if previous is not None and speed > 0:
+            # 录像中断（摄像头断开）时不要等待整段空白
+            time.sleep(min(max(timestamp - previous, 0) / speed, 1.0))
+        previous = timestamp
+        yield multipart_chunk(jpg)
+
+@robot_route('/replay')
+def replay(robot_id):
+    """录像回放：/replay?from=<时间戳或负秒数>&to=...&speed=1.0"""
+    robot = get_robot(robot_id)
+    try:
+        start = parse_time_arg(request.args.get('from'), -60)
+        end = parse_time_arg(request.args.get('to'))
+        speed = float(request.args.get('speed', 1.0))
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Invalid from/to/speed'}), 400
+    return Response(generate_replay(robot, start, end, speed),
+                    mimetype='multipart/x-mixed-replace; boundary=frame')
+
+@robot_route('/api/recording', methods=['GET'])
+def recording_status(robot_id):
+    """录像状态：分段数、最早/最新时间等"""
+    return jsonify({'enabled': RECORDING_ENABLED, **get_robot(robot_id).recorder.stats()})
+
+@robot_route('/api/analytics', methods=['GET'])
+def analytics_status(robot_id):
+    """帧分析的取样/跳过计数和最近一次结果；结果本身也随 /api/status/stream 推送"""
+    robot = get_robot(robot_id)
+    if robot.analytics is None:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **robot.analytics.stats()})
+
+@robot_route('/api/recording/export', methods=['GET'])
+def export_recording(robot_id):
+    """导出一段录像为 multipart MJPEG 文件：/api/recording/export?from=...&to=..."""
+    robot = get_robot(robot_id)
+    try:
+        start = parse_time_arg(request.args.get('from'), -60)
+        end = parse_time_arg(request.args.get('to'), time.time())
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Invalid from/to'}), 400
+    clip = (multipart_chunk(jpg) for _, jpg in robot.recorder.frames(start, end))
+    filename = f"clip-{robot.id}-{time.strftime('%Y%m%d-%H%M%S', time.localtime(start))}.mjpeg"
+    return Response(clip, mimetype='multipart/x-mixed-replace; boundary=frame',
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+@robot_route('/api/snapshot', methods=['GET'])
+def snapshot(robot_id):
+    """最新一帧静态图，可选 w/q 生成缩略图（按尺寸缓存）；支持 ETag/Last-Modified 条件请求"""
+    robot = get_robot(robot_id)
+    latest = robot.video.snapshot(SNAPSHOT_TIMEOUT, SNAPSHOT_HOLD)
+    if latest is None:
+        return jsonify({'status': 'error', 'message': 'No frame available'}), 503
+    seq, jpg, frame_time = latest
+
+    profile = VideoProfile.from_args(request.args)
+    if profile.needs_transform:
+        jpg = robot.variants.get(seq, jpg, profile)
+        if jpg is None:
+            return jsonify({'status': 'error', 'message': 'Failed to encode snapshot'}), 500
+
+    response = Response(jpg, mimetype='image/jpeg')
+    response.set_etag(f"{BOOT_ID}-{robot.id}-{seq}-{profile.width or 0}-{profile.quality or 0}")
+    response.last_modified = frame_time
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+@robot_route('/api/video/latency', methods=['GET'])
+def video_latency(robot_id):
+    """视频帧率和各阶段延迟（毫秒）：camera 源到服务器、deliver 到达到写完socket、total 源到写完socket"""
+    return jsonify(get_robot(robot_id).latency.summary())
+
+@robot_route('/api/status', methods=['GET'])
+def get_status(robot_id):
     """获取当前状态"""
-    return jsonify(update_status())
+    return jsonify(get_robot(robot_id).record_command())
+
+metrics.enable(METRICS_ENABLED)
+metrics.registry.gauge('robot_connected', 'Whether the robot link is connected',
+                       lambda: {(('robot', robot.id),): int(robot.link.connected) for robot in fleet})
+metrics.registry.gauge('robot_link_commands', 'Robot link command counters',
+                       lambda: {(('robot', robot.id), ('kind', key)): value
+                                for robot in fleet for key, value in robot.link.stats().items()
+                                if isinstance(value, int)})
+metrics.registry.gauge('hold_repeater_events', 'Server-side hold repeater counters',
+                       lambda: {(('robot', robot.id), ('kind', kind)): value for robot in fleet
+                                for kind, value in (('repeats', robot.hold.repeats),
+                                                    ('deadman_stops', robot.hold.deadman_stops))})
+metrics.registry.gauge('command_audit_records', 'Command audit log counters',
+                       lambda: {(('kind', key),): value for key, value in audit_log.stats().items()
+                                if key not in ('sample_every', 'buffered')})
+metrics.registry.gauge('video_viewers', 'Connected /video_feed clients',
+                       lambda: {(('robot', robot.id),): robot.video.viewers for robot in fleet})
+metrics.registry.gauge('video_variant_cache', 'Encoded variant cache counters',
+                       lambda: {(('robot', robot.id), ('kind', kind)): value for robot in fleet
+                                for kind, value in (('profiles', len(robot.variants.profiles())),
+                                                    ('encodes', robot.variants.encodes),
+                                                    ('hits', robot.variants.hits))})
+
+analytics_pool = None  # 帧分析的进程池，在 start() 中创建
+
+def observe_client_delay(timestamp, robot):
+    """记录浏览器时间戳到服务器收到请求的延迟（依赖两端时钟同步，负值忽略）"""
+    if not metrics.enabled or not timestamp:
+        return
+    try:
+        sent = datetime.fromisoformat(str(timestamp).replace('Z', '+00:00'))
+        delay = (datetime.now(timezone.utc) - sent).total_seconds()
+    except (ValueError, TypeError):
+        return
+    if delay >= 0:
+        metrics.observe('robot_command_client_to_server_seconds', delay,
+                        'Browser timestamp to server receive, seconds', robot=robot.id)
+
+def execute_command(robot, command, event=None, client=None, channel=None):
+    """执行一条命令并写入审计日志，返回 (是否成功, 提示信息)，HTTP 与 WebSocket 通道共用"""
+    started = time.perf_counter()
+    success, message, result = False, None, 'exception'
+    try:
+        success, message = robot.dispatch(command, event, client)
+        result = 'ok' if success else 'error'
+        return success, message
+    finally:
+        audit_log.record(command, event, client, channel, time.perf_counter() - started, result,
+                         None if success else message, robot=robot.id)
 
-@app.route('/api/command', methods=['POST'])
-def handle_command():
+def generate_status_events(status_bus, last_version):
+    """SSE：先发完整快照，之后只在状态变化时发送合并后的增量"""
+    version, state = status_bus.snapshot()
+    if last_version is None or last_version > version:
+        payload, event = state, 'snapshot'
+    else:
+        version, payload, full = status_bus.changes_since(last_version)
+        event = 'snapshot' if full else 'delta'
+    yield f"id: {version}\nevent: {event}\ndata: {json.dumps(payload, separators=(',', ':'))}\n\n"
+
+    while True:
+        changes = status_bus.wait(version, timeout=STATUS_KEEPALIVE)
+        if changes is None:
+            if status_bus.closed:
+                return
+            yield ": keepalive\n\n"
+            continue
+        # 高频计数变化（按住移动时每秒10次）在一个窗口内合并为一条消息
+        time.sleep(STATUS_COALESCE)
+        version, payload, full = status_bus.changes_since(version)
+        event = 'snapshot' if full else 'delta'
+        yield f"id: {version}\nevent: {event}\ndata: {json.dumps(payload, separators=(',', ':'))}\n\n"
+
+@robot_route('/api/status/stream')
+def status_stream(robot_id):
+    """状态推送（Server-Sent Events），断线重连时根据 Last-Event-ID 只补发增量"""
+    robot = get_robot(robot_id)
+    try:
+        last_version = int(request.headers.get('Last-Event-ID'))
+    except (TypeError, ValueError):
+        last_version = None
+    response = Response(generate_status_events(robot.status, last_version), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@robot_route('/api/command', methods=['POST'])
+def handle_command(robot_id):
     """处理命令请求"""
+    robot = get_robot(robot_id)
+    trace = metrics.trace('robot_command', channel='http', robot=robot.id)
     try:
         data = request.get_json()
+        trace.mark('parse')
         command = data.get('command')
-        button_id = data.get('button_id')
         timestamp = data.get('timestamp')
+        event = data.get('event')
+        client = data.get('client_id')
+        observe_client_delay(timestamp, robot)
+
+        success, message = execute_command(robot, command, event, client, 'http')
+        trace.mark('dispatch')
+        response = {
+            'status': 'success' if success else 'error',
+            'status_info': robot.record_command()
+        }
+        if message:
+            response['message'] = message
+        trace.finish('ok' if success else 'error')
+        return jsonify(response)
 
-        logging.info(f"\n[Command Request] {'-'*50}")
-        logging.info(f"Command: {command}")
-        logging.info(f"Button: {button_id}")
-        logging.info(f"Time: {timestamp}")
-        logging.info(f"{'='*60}\n")
-        
-        if command == 'connect':
-            success = connect_to_robot()
-            return jsonify({
-                'status': 'success' if success else 'error',
-                'status_info': update_status()
-            })
-        elif command == 'disconnect':
-            global robot_socket
-            if robot_socket:
-                try:
-                    robot_socket.close()
-                except Exception as e:
-                    logging.error(f"Error closing connection: {str(e)}")
-                robot_socket = None
-            return jsonify({
-                'status': 'success',
-                'status_info': update_status()
-            })
-        else:
-            if not robot_socket:
-                return jsonify({
-                    'status': 'error',
-                    'message': 'Not connected to robot',
-                    'status_info': update_status()
-                })
-            
-            success = send_robot_command(command)
-            return jsonify({
-                'status': 'success' if success else 'error',
-                'message': 'Command sent' if success else 'Failed to send command',
-                'status_info': update_status()
-            })
-            
     except Exception as e:
         error_msg = str(e)
         logging.error(f"Error handling command: {error_msg}")
+        trace.finish('exception')
         return jsonify({
             'status': 'error',
             'message': error_msg,
-            'status_info': update_status()
+            'status_info': robot.record_command()
         })
 
+@app.route('/api/audit', methods=['GET'])
+def get_audit():
+    """最近的命令审计记录（内存环形缓冲，从旧到新），limit 限制条数"""
+    limit = request.args.get('limit', type=int)
+    return jsonify({'entries': audit_log.recent(limit if limit and limit > 0 else None),
+                    'stats': audit_log.stats()})
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus 文本格式的指标"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+if sock is not None:
+    def command_channel(ws, robot_id):
+        """持久化命令通道：消息为紧凑JSON {"s": 序号, "c": 命令, "e": 事件, "t": 客户端时间}
+
+        每条消息回复 {"a": 序号, "ok": 0/1, "t": 原样返回的客户端时间}，页面据此计算往返时延；
+        序号不大于上一条的过期消息直接拒绝，不会发给机器人。
+        """
+        robot = fleet.default if robot_id is None else fleet.get(robot_id)
+        if robot is None:
+            ws.close(reason=1008, message=f"Unknown robot: {robot_id}")
+            return
+        last_seq = 0
+        client = f"ws-{id(ws)}"
+        while True:
+            try:
+                raw = ws.receive()
+            except Exception:
+                break
+            if raw is None:
+                break
+            trace = metrics.trace('robot_command', channel='ws', robot=robot.id)
+            try:
+                message = json.loads(raw)
+                seq = int(message.get('s', 0))
+                command = message.get('c')
+                event = message.get('e')
+            except (ValueError, TypeError, AttributeError):
+                ws.send('{"ok":0,"m":"bad message"}')
+                trace.finish('bad_message')
+                continue
+            trace.mark('parse')
+
+            ack = {'a': seq, 't': message.get('t')}
+            if seq <= last_seq:
+                ack.update(ok=0, m='stale')
+            else:
+                last_seq = seq
+                try:
+                    success, info = execute_command(robot, command, event, client, 'ws')
+                except Exception as e:
+                    logging.error(f"Error handling command: {str(e)}")
+                    success, info = False, str(e)
+                trace.mark('dispatch')
+                ack['ok'] = int(success)
+                if info and not success:
+                    ack['m'] = info
+                if command in ('connect', 'disconnect'):
+                    ack['st'] = robot.record_command()
+            ws.send(json.dumps(ack, separators=(',', ':')))
+            trace.finish('ok' if ack['ok'] else 'error')
+
+        # 连接断开视为松开，避免机器人在客户端消失后继续移动
+        robot.hold.release(client)
+
+    # flask-sock 的装饰器为每个路由包装一个新函数且不返回它，两条路径分别注册并使用不同的 endpoint
+    sock.route('/ws/command', defaults={'robot_id': None})(command_channel)
+    sock.route('/robot/<robot_id>/ws/command', endpoint='robot_command_channel')(command_channel)
+
+def start():
+    """启动审计日志、I/O线程，加载车队，再启动录像和帧分析；由 __main__ 和 serve.py 在开始服务前调用
+
+    不放在模块顶层：帧分析进程池使用 spawn，以 python server.py 运行时
+    每个工作进程都会把本文件作为 __mp_main__ 重新导入，导入时不能有任何副作用。
+    """
+    global io_loop, analytics_pool
+    if io_loop is not None:
+        return
+    audit_log.start()
+    atexit.register(audit_log.stop)  # 退出前写完队列中的记录
+    io_loop = default_loop()
+    for robot in load_fleet():
+        fleet.add(robot)
+
+    if RECORDING_ENABLED:
+        for robot in fleet:
+            robot.recorder.start()
+
+    if ANALYTICS_ENABLED:
+        from frame_analytics import create_pool
+        analytics_pool = create_pool(ANALYTICS_WORKERS)
+        for robot in fleet:
+            robot.start_analytics(analytics_pool, rate_hz=ANALYTICS_RATE_HZ, max_in_flight=ANALYTICS_WORKERS,
+                                  size=ANALYTICS_SIZE, motion_threshold=ANALYTICS_MOTION_THRESHOLD)
+
+def shutdown(timeout=2.0):
+    """优雅退出：先停止按住移动并把已排队的停止命令写给机器人，再关闭摄像头连接和后台线程
+
+    关闭状态总线和视频广播器后，所有SSE和MJPEG长连接的生成器都会自然结束。
+    """
+    logging.info("Shutting down robot control server")
+    if analytics_pool:
+        # 先等进程池结束：在途任务的回调都执行完之后才能释放帧分析的共享内存槽位
+        analytics_pool.shutdown(wait=True, cancel_futures=True)
+    fleet.shutdown(timeout)
+    if io_loop:
+        io_loop.stop()
+    audit_log.stop()
+
 if __name__ == '__main__':
+    # 开发用的单进程多线程服务器；生产环境使用 serve.py
     logging.info("\nStarting Robot Control Server...")
-    logging.info(f"Server IP: {SERVER_IP}")
-    logging.info(f"Robot Control Port: {SERVER_PORT}")
-    logging.info(f"Video Stream Port: {VIDEO_PORT}")
+    start()
+    for robot in fleet:
+        logging.info(f"Robot {robot.id}: {robot.host} control port {robot.port}, video port {robot.video_port}")
     logging.info("\nWaiting for connections...\n")
-    app.run(host='127.0.0.1', port=5000, debug=True)
+    try:
+        app.run(host=LISTEN_HOST, port=LISTEN_PORT, threaded=True,
+                debug=os.environ.get('FLASK_DEBUG', '').lower() in ('1', 'true', 'yes'))
+    finally:
+        shutdown()
@@ -0,0 +1,236 @@
+"""本地机器人模拟器：合成画面的MJPEG摄像头 + 记录每条命令到达时间的TCP控制端口
+
+用法: python simulator.py [--video-port 8080 --control-port 8082 --size 640x480 --fps 15 --jpeg-kb 40]
+然后以 ROBOT_IP=127.0.0.1 启动 server.py/serve.py（或把 integrated_controller.py 指向本机）。
+
+每帧在SOI之后带一个COM段 "ts=<发送时的Unix时间>"，便于测量画面到达各端的延迟；
+控制端口按行接收命令并记录到达时间，基准测试可以直接在进程内读取。
+"""
+import argparse
+import bisect
+import logging
+import socket
+import socketserver
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from mjpeg import MAX_COMMENT_SIZE, add_comment
+
+BOUNDARY = b'frame'
+
+
+def render_frames(width, height, count, quality=80):
+    """预先渲染一组循环播放的画面：移动的渐变和色块，带帧号"""
+    import numpy as np
+    from frame_codec import draw_overlay, encode_jpeg
+
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    frames = []
+    for i in range(count):
+        phase = i * 256 / count
+        frame = np.empty((height, width, 3), dtype=np.uint8)
+        frame[..., 0] = (x + phase) % 256
+        frame[..., 1] = (y + phase / 2) % 256
+        frame[..., 2] = ((x + y) / 2) % 256
+        size = max(8, min(width, height) // 6)
+        left = int((width - size) * i / max(count - 1, 1))
+        frame[height // 2 - size // 2:height // 2 + size // 2, left:left + size] = 255
+        draw_overlay(frame, f"SIM {i:03d}")
+        frames.append(encode_jpeg(frame, quality))
+    return frames
+
+
+def pad_jpeg(jpg, target_size):
+    """用 COM 段把JPEG补齐到目标大小（已经更大时不变）"""
+    while len(jpg) + 4 <= target_size:
+        padding = min(target_size - len(jpg) - 4, MAX_COMMENT_SIZE)
+        jpg = add_comment(jpg, b'\0' * padding)
+    return jpg
+
+
+class SimulatedCamera:
+    """合成画面的MJPEG HTTP服务器
+
+    所有连接共用同一时钟：同一时刻每个客户端收到的是同一帧，帧率由起始时间 + n*周期 决定。
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, size=(640, 480), fps=15, quality=80, jpeg_size=None,
+                 loop_frames=30):
+        self.fps = fps
+        self.frames = render_frames(size[0], size[1], loop_frames, quality)
+        if jpeg_size:
+            self.frames = [pad_jpeg(jpg, jpeg_size) for jpg in self.frames]
+        self.started = time.monotonic()
+        self.clients = 0
+        self.frames_sent = 0
+        self._lock = threading.Lock()
+
+        camera = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.0'
+
+            def do_GET(self):
+                camera._stream(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.port = self.server.server_address[1]
+        self._thread = None
+
+    def _stream(self, handler):
+        handler.send_response(200)
+        handler.send_header('Content-Type', f'multipart/x-mixed-replace; boundary={BOUNDARY.decode()}')
+        handler.send_header('Cache-Control', 'no-cache')
+        handler.end_headers()
+        with self._lock:
+            self.clients += 1
+        try:
+            period = 1.0 / self.fps
+            tick = int((time.monotonic() - self.started) / period) + 1
+            while True:
+                delay = self.started + tick * period - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                jpg = add_comment(self.frames[tick % len(self.frames)], b'ts=%.6f' % time.time())
+                handler.wfile.write(b'--' + BOUNDARY + b'\r\nContent-Type: image/jpeg\r\nContent-Length: '
+                                    + str(len(jpg)).encode('ascii') + b'\r\n\r\n' + jpg + b'\r\n')
+                handler.wfile.flush()
+                with self._lock:
+                    self.frames_sent += 1
+                # 客户端跟不上时跳到当前节拍，不补发
+                tick = max(tick + 1, int((time.monotonic() - self.started) / period))
+        except OSError:
+            pass
+        finally:
+            with self._lock:
+                self.clients -= 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="sim-camera", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class CommandSink:
+    """模拟机器人控制端口：按行接收命令，记录 (到达的Unix时间, 命令)"""
+
+    def __init__(self, host='127.0.0.1', port=0, history=100000):
+        self.history = history
+        self.received = deque(maxlen=history)
+        self.total = 0
+        self.connections = 0
+        self._arrivals = {}  # 命令 -> 按时间排序的到达时间列表
+        self._cond = threading.Condition()
+
+        sink = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                with sink._cond:
+                    sink.connections += 1
+                try:
+                    for line in self.rfile:
+                        sink._record(time.time(), line.strip().decode('utf-8', 'replace'))
+                finally:
+                    with sink._cond:
+                        sink.connections -= 1
+
+        self.server = _TCPServer((host, port), Handler)
+        self.port = self.server.server_address[1]
+        self._thread = None
+
+    def _record(self, timestamp, command):
+        with self._cond:
+            self.received.append((timestamp, command))
+            arrivals = self._arrivals.setdefault(command, [])
+            arrivals.append(timestamp)
+            if len(arrivals) > 2 * self.history:
+                del arrivals[:self.history]
+            self.total += 1
+            self._cond.notify_all()
+
+    def wait_for(self, command, since, timeout=2.0):
+        """等待 since 之后第一次收到 command，返回到达时间；超时返回 None"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                arrivals = self._arrivals.get(command, ())
+                index = bisect.bisect_left(arrivals, since)
+                if index < len(arrivals):
+                    return arrivals[index]
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+    def commands(self, since=0.0):
+        with self._cond:
+            return [item for item in self.received if item[0] >= since]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="sim-robot", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def parse_size(value):
+    width, _, height = value.lower().partition('x')
+    return int(width), int(height)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local robot simulator: MJPEG camera + command sink')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--video-port', type=int, default=8080)
+    parser.add_argument('--control-port', type=int, default=8082)
+    parser.add_argument('--size', type=parse_size, default=(640, 480), help='WIDTHxHEIGHT')
+    parser.add_argument('--fps', type=float, default=15)
+    parser.add_argument('--quality', type=int, default=80)
+    parser.add_argument('--jpeg-kb', type=int, default=0, help='pad each frame to this size with COM segments')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+    camera = SimulatedCamera(args.host, args.video_port, args.size, args.fps, args.quality,
+                             args.jpeg_kb * 1024).start()
+    sink = CommandSink(args.host, args.control_port).start()
+    logging.info(f"Simulated camera on http://{args.host}:{camera.port}/ "
+                 f"({args.size[0]}x{args.size[1]} @ {args.fps:g} fps, {len(camera.frames[0]) // 1024} KB/frame)")
+    logging.info(f"Command sink on {args.host}:{sink.port}")
+
+    last_total = 0
+    try:
+        while True:
+            time.sleep(5)
+            recent = sink.commands(time.time() - 5)
+            logging.info(f"viewers={camera.clients} commands={sink.total - last_total}/5s "
+                         f"last={recent[-1][1] if recent else '-'}")
+            last_total = sink.total
+    except KeyboardInterrupt:
+        pass
+    finally:
+        camera.close()
+        sink.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+import threading
+from collections import deque
+
+
+class StatusBus:
+    """带版本号的共享状态
+
+    只有字段值真正变化时版本号才递增，并保存这一版的增量；
+    订阅者带着自己已知的版本等待，拿到的是合并后的增量，太旧时拿到完整快照。
+    读取快照不做任何计算，直接返回缓存的副本。
+    """
+
+    def __init__(self, initial, history=256):
+        self._cond = threading.Condition()
+        self._state = dict(initial)
+        self._snapshot = dict(initial)
+        self._version = 0
+        self._history = deque(maxlen=history)  # (版本号, 增量)
+        self._closed = False
+
+    @property
+    def version(self):
+        return self._version
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def snapshot(self):
+        """返回 (版本号, 状态副本)"""
+        with self._cond:
+            return self._version, self._snapshot
+
+    def update(self, **changes):
+        """更新字段，有变化时发布新版本并返回版本号，否则返回 None"""
+        with self._cond:
+            delta = {key: value for key, value in changes.items() if self._state.get(key) != value}
+            if not delta:
+                return None
+            self._state.update(delta)
+            self._snapshot = dict(self._state)
+            self._version += 1
+            self._history.append((self._version, delta))
+            self._cond.notify_all()
+            return self._version
+
+    def increment(self, counters, **changes):
+        """原子地累加计数字段 {字段: 增量}，并同时更新其他字段"""
+        with self._cond:
+            totals = {key: self._state.get(key, 0) + amount for key, amount in counters.items()}
+            return self.update(**totals, **changes)
+
+    def changes_since(self, version):
+        """返回 (最新版本号, 增量, 是否为完整快照)"""
+        with self._cond:
+            return self._changes_since(version)
+
+    def wait(self, version, timeout=None):
+        """等待比 version 更新的版本，超时返回 None"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._version > version or self._closed, timeout):
+                return None
+            if self._closed:
+                return None
+            return self._changes_since(version)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def _changes_since(self, version):
+        if version >= self._version:
+            return self._version, {}, False
+        if not self._history or self._history[0][0] > version + 1:
+            return self._version, dict(self._snapshot), True
+        merged = {}
+        for item_version, delta in self._history:
+            if item_version > version:
+                merged.update(delta)
+        return self._version, merged, False
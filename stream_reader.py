@@ -0,0 +1,167 @@
+import logging
+import random
+import socket
+import threading
+import time
+
+from core import CONNECTING, STALLED, STOPPED, STREAMING
+from mjpeg import DEFAULT_CHUNK_SIZE, MJPEGParser, iter_chunks
+
+
+def pooled_session():
+    """复用TCP连接的 requests 会话；每个读取器同一时刻只有一个连接
+
+    requests 在这里才导入，只有真正打开视频流时才付出加载它的时间。
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1, max_retries=0)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def _read_timeouts():
+    """读取超时：连接时由 requests 包装，流式读取时是 urllib3 或 socket 的原始异常"""
+    import requests
+    from urllib3.exceptions import ReadTimeoutError
+
+    return requests.exceptions.ReadTimeout, ReadTimeoutError, socket.timeout
+
+
+class SupervisedStream:
+    """自动重连的MJPEG读取器
+
+    连接失败、上游关闭或超过 stall_timeout 没有解析出完整帧时视为中断，
+    按抖动的指数退避重新连接（上限 backoff_max），收到第一帧后退避复位。
+    退避上限小于1秒，摄像头恢复后一秒内即可重新出画。
+    run() 在调用者的线程中阻塞运行，直到 stop()；stop() 可以先于 run() 调用，停止后不能再次运行。
+    """
+
+    def __init__(self, url, on_frame, on_state=None, chunk_size=DEFAULT_CHUNK_SIZE, stall_timeout=2.0,
+                 connect_timeout=2.0, backoff_initial=0.1, backoff_max=0.8, session=None):
+        self.url = url
+        self.on_frame = on_frame  # on_frame(jpg)，在读取线程中调用
+        self.on_state = on_state  # on_state(state)，状态变化时调用
+        self.chunk_size = chunk_size
+        self.stall_timeout = stall_timeout
+        self.connect_timeout = connect_timeout
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.session = session  # 为空时在 run() 中创建
+        self.parser = MJPEGParser()
+
+        self.state = STOPPED
+        self.reconnects = 0  # 中断后重新连接的次数
+        self.stalls = 0      # 因超时没有完整帧而断开的次数
+        self.last_frame_time = None
+        self._failing = False  # 连续失败期间只记录第一次错误，避免摄像头离线时刷屏
+        self._running = True
+        self._wakeup = threading.Event()
+        self._response = None
+        self._lock = threading.Lock()
+
+    def _set_state(self, state):
+        if state == self.state:
+            return
+        self.state = state
+        # 重连过程中的状态每次重试都会出现，只在恢复和停止时记录
+        log = logging.info if state in (STREAMING, STOPPED) else logging.debug
+        log(f"Video stream {self.url} {state}")
+        if self.on_state:
+            self.on_state(state)
+
+    def run(self):
+        if self.session is None:
+            self.session = pooled_session()
+        backoff = self.backoff_initial
+        first = True
+        while self._running:
+            if not first:
+                self.reconnects += 1
+            first = False
+            self._set_state(CONNECTING)
+            if self._read_once():
+                backoff = self.backoff_initial
+            if not self._running:
+                break
+            self._set_state(STALLED)
+            self._wakeup.wait(backoff * random.uniform(0.5, 1.0))
+            backoff = min(backoff * 2, self.backoff_max)
+        self._set_state(STOPPED)
+
+    def _read_once(self):
+        """读取一次连接直到中断，收到过帧时返回 True"""
+        self.parser = MJPEGParser()  # 丢弃上一次连接残留的半帧
+        read_timeouts = _read_timeouts()
+        streamed = False
+        try:
+            # 读取超时按数据块计算：stall_timeout 内一个字节都没有时直接抛出
+            response = self.session.get(self.url, stream=True,
+                                        timeout=(self.connect_timeout, self.stall_timeout))
+            with self._lock:
+                self._response = response
+            with response:
+                if response.status_code != 200:
+                    self._log_failure(f"Video stream returned HTTP {response.status_code}")
+                    return False
+                last_frame = time.monotonic()
+                for chunk in iter_chunks(response, self.chunk_size):
+                    if not self._running:
+                        return streamed
+                    now = time.monotonic()
+                    frames = self.parser.feed(chunk)
+                    if frames:
+                        last_frame = now
+                        self.last_frame_time = time.time()
+                        if not streamed:
+                            streamed = True
+                            self._failing = False
+                            self._set_state(STREAMING)
+                        for jpg in frames:
+                            self.on_frame(jpg)
+                    elif now - last_frame > self.stall_timeout:
+                        # 有数据但一直凑不出完整帧（例如上游卡住或输出损坏）
+                        self.stalls += 1
+                        logging.warning(f"No complete frame for {now - last_frame:.1f}s, reconnecting")
+                        return streamed
+                logging.warning("Video stream closed by upstream")
+        except read_timeouts:
+            self.stalls += 1
+            logging.warning(f"Video stream stalled for {self.stall_timeout:.1f}s, reconnecting")
+        except Exception as e:
+            if self._running:
+                self._log_failure(f"Video stream error: {str(e)}")
+        finally:
+            with self._lock:
+                self._response = None
+        return streamed
+
+    def _log_failure(self, message):
+        if self._failing:
+            logging.debug(message)
+        else:
+            self._failing = True
+            logging.error(message)
+
+    def stop(self):
+        """停止读取；正在阻塞的读取会被关闭连接打断"""
+        self._running = False
+        self._wakeup.set()
+        with self._lock:
+            response = self._response
+        if response is not None:
+            try:
+                response.close()
+            except Exception:
+                pass
+
+    def stats(self):
+        return {
+            'state': self.state,
+            'reconnects': self.reconnects,
+            'stalls': self.stalls,
+            'last_frame_time': self.last_frame_time,
+        }
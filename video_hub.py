@@ -0,0 +1,232 @@
+import threading
+import logging
+import time
+from mjpeg import DEFAULT_CHUNK_SIZE
+from core import STOPPED, STREAMING
+from stream_reader import SupervisedStream, pooled_session
+
+
+class FrameCursor:
+    """单个客户端的读取游标：始终取最新帧，落后时直接丢弃旧帧
+
+    keepalive 为真时，上游中断期间每个超时周期重发一次最新帧：
+    浏览器保持最后画面，已断开的客户端也能在写出时被发现。
+    """
+
+    def __init__(self, hub, timeout=5.0, keepalive=False):
+        self.hub = hub
+        self.timeout = timeout
+        self.keepalive = keepalive
+        self.last_seq = 0
+        self.frame_time = None   # 当前帧到达解析器的Unix时间
+        self.source_time = None  # 当前帧自带的源时间戳，没有时为 None
+        self.repeated = False    # 当前帧是保活重发的旧帧
+        self.dropped = 0  # 因落后而跳过的帧数
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.closed:
+            raise StopIteration
+        result = self.hub.wait_frame(self.last_seq, self.timeout)
+        if result is None and self.keepalive:
+            result = self.hub.stalled_frame()
+        if result is None:
+            self.close()
+            raise StopIteration
+        seq, jpg, self.frame_time, self.source_time = result
+        self.repeated = seq == self.last_seq
+        if self.last_seq and seq > self.last_seq + 1:
+            self.dropped += seq - self.last_seq - 1
+        self.last_seq = seq
+        return jpg
+
+    def close(self):
+        """释放游标，最后一个游标关闭时上游连接随之停止"""
+        if not self.closed:
+            self.closed = True
+            self.hub.unsubscribe(self)
+
+
+class VideoHub:
+    """MJPEG广播器：每个摄像头只有一个上游读取线程，所有客户端共享最新帧
+
+    上游由 SupervisedStream 读取：断线或卡住时自动重连，直到没有客户端为止。
+    """
+
+    def __init__(self, url, chunk_size=DEFAULT_CHUNK_SIZE, timeout=5, stall_timeout=2.0, on_state=None,
+                 latency=None):
+        self.url = url
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.stall_timeout = stall_timeout
+        self.on_state = on_state  # on_state(state)，上游读取状态变化时调用
+        self.latency = latency    # VideoLatency，记录帧到达和源延迟
+        self.state = STOPPED
+        self.session = None  # 重连时复用的连接池，第一次打开上游时创建
+        self._stream = None
+
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+        self._generation = 0  # 每次重启上游递增，旧线程据此自行退出
+        self._cursors = set()
+
+        # 最新帧槽位：序号单调递增，客户端据此判断是否有新帧
+        self._seq = 0
+        self._frame = None
+        self._frame_time = None  # 最新帧到达的Unix时间
+        self._frame_source = None  # 最新帧自带的源时间戳
+
+        # 快照自己持有的游标：没有观看者时也能打开上游，最后一次请求后 hold 秒关闭
+        self._snapshot_lock = threading.Lock()
+        self._snapshot_cursor = None
+        self._snapshot_until = 0.0
+
+    @property
+    def viewers(self):
+        with self._cond:
+            return len(self._cursors)
+
+    def latest(self):
+        """返回缓存的最新帧 (序号, JPEG字节, 到达时间)；上游没有在出画时返回 None，不会打开上游连接"""
+        with self._cond:
+            if self._frame is None or self.state != STREAMING:
+                return None
+            return self._seq, self._frame, self._frame_time
+
+    def snapshot(self, timeout=3.0, hold=10.0):
+        """返回最新帧 (序号, JPEG字节, 到达时间)，必要时自己订阅上游并等待第一帧
+
+        订阅在最后一次调用后保持 hold 秒，连续轮询复用同一个上游连接；
+        timeout 内上游仍没有出画（摄像头离线或重连中）时返回 None。
+        """
+        with self._snapshot_lock:
+            self._snapshot_until = time.monotonic() + hold
+            if self._snapshot_cursor is None:
+                self._snapshot_cursor = cursor = self.subscribe()
+                threading.Thread(target=self._release_snapshot, args=(cursor,),
+                                 name="video-hub-snapshot", daemon=True).start()
+        with self._cond:
+            self._cond.wait_for(lambda: self._frame is not None and self.state == STREAMING, timeout)
+        return self.latest()
+
+    def _release_snapshot(self, cursor):
+        """快照游标闲置超过 hold 秒后关闭；没有其他客户端时上游随之停止"""
+        while True:
+            with self._snapshot_lock:
+                remaining = self._snapshot_until - time.monotonic()
+                if remaining <= 0 or cursor.closed:
+                    self._snapshot_cursor = None
+                    break
+            time.sleep(remaining)
+        cursor.close()
+
+    def subscribe(self, timeout=5.0, keepalive=False):
+        """注册一个客户端游标，必要时启动上游读取线程"""
+        cursor = FrameCursor(self, timeout, keepalive)
+        with self._cond:
+            self._cursors.add(cursor)
+            # 新客户端从当前最新帧开始，不回放历史帧
+            cursor.last_seq = self._seq - 1 if self._frame is not None else self._seq
+            if not self._running:
+                self._running = True
+                self._generation += 1
+                self._thread = threading.Thread(target=self._reader, args=(self._generation,),
+                                                name="video-hub", daemon=True)
+                self._thread.start()
+        return cursor
+
+    def unsubscribe(self, cursor):
+        """注销客户端游标，没有客户端时停止上游读取"""
+        with self._cond:
+            self._cursors.discard(cursor)
+            stream = None
+            if not self._cursors:
+                self._running = False
+                stream = self._stream
+                self._frame = None  # 上游停止后不再把旧帧当作最新帧
+            self._cond.notify_all()
+        if stream:
+            stream.stop()
+
+    def wait_frame(self, last_seq, timeout):
+        """等待比 last_seq 更新的帧，上游结束或超时返回 None"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._seq > last_seq or not self._running, timeout):
+                return None
+            if self._seq <= last_seq:
+                return None
+            return self._seq, self._frame, self._frame_time, self._frame_source
+
+    def stalled_frame(self):
+        """上游仍在运行（重连中）时返回当前最新帧，用于保活重发"""
+        with self._cond:
+            if not self._running or self._frame is None:
+                return None
+            return self._seq, self._frame, self._frame_time, self._frame_source
+
+    def publish(self, jpg):
+        """发布一帧到最新帧槽位并唤醒所有等待的客户端"""
+        arrival = time.time()
+        source = self.latency.frame(jpg, arrival) if self.latency else None
+        with self._cond:
+            self._frame = jpg
+            self._frame_time = arrival
+            self._frame_source = source
+            self._seq += 1
+            self._cond.notify_all()
+
+    def stop(self):
+        """停止上游读取线程"""
+        with self._cond:
+            self._running = False
+            stream = self._stream
+            self._frame = None
+            self._cond.notify_all()
+        if stream:
+            stream.stop()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=self.timeout)
+
+    def _alive(self, generation):
+        return self._running and self._generation == generation
+
+    def _set_state(self, generation, state):
+        # 已被新一轮读取取代的线程不再上报状态
+        if self._generation != generation:
+            return
+        self.state = state
+        if self.on_state:
+            self.on_state(state)
+
+    def _reader(self, generation):
+        """上游读取线程：解析MJPEG流并发布完整JPEG帧，中断后自动重连"""
+        def on_frame(jpg):
+            if self._alive(generation):
+                self.publish(jpg)
+            else:
+                stream.stop()
+
+        if self.session is None:
+            self.session = pooled_session()
+        stream = SupervisedStream(self.url, on_frame, on_state=lambda state: self._set_state(generation, state),
+                                  chunk_size=self.chunk_size, stall_timeout=self.stall_timeout,
+                                  connect_timeout=self.timeout, session=self.session)
+        with self._cond:
+            if not self._alive(generation):
+                return
+            self._stream = stream
+        logging.info(f"Opening upstream video stream {self.url}")
+        try:
+            stream.run()
+        finally:
+            with self._cond:
+                if self._stream is stream:
+                    self._stream = None
+                if self._generation == generation:
+                    self._running = False
+                self._cond.notify_all()
+            logging.info("Upstream video stream closed")
@@ -0,0 +1,82 @@
+import threading
+import time
+from collections import deque
+
+import metrics
+from mjpeg import frame_timestamp
+
+# 叠加层默认显示的分位数
+OVERLAY_QUANTILES = (0.5, 0.95)
+
+
+class VideoLatency:
+    """一路视频的延迟统计：各阶段最近 window 秒的滚动直方图和到达帧率
+
+    每帧以到达解析器的时间为基准，后续阶段（解码、缩放、绘制或写出socket）都相对它计时；
+    帧里带有 "ts=" 注释（模拟器写入）时另外记录 camera（源到到达）和 total（源到显示/写出）。
+    metric 不为空时样本同时写入 /api/metrics 的累计直方图 <metric>{stage=...}。
+    """
+
+    def __init__(self, window=10.0, metric=None, **labels):
+        self.window = window
+        self.metric = metric
+        self.labels = labels
+        self._stages = {}  # 阶段 -> RollingHistogram，按首次出现的顺序
+        self._arrivals = deque()  # 最近 window 秒内的到达时间，用于计算帧率
+        self._lock = threading.Lock()
+
+    def frame(self, jpg, arrival=None):
+        """记录一帧到达，返回帧里带的源时间戳（没有时为 None）"""
+        arrival = arrival or time.time()
+        with self._lock:
+            self._arrivals.append(arrival)
+            while arrival - self._arrivals[0] > self.window:
+                self._arrivals.popleft()
+        source = frame_timestamp(jpg)
+        if source is not None:
+            self.observe('camera', arrival - source)
+        return source
+
+    def observe(self, stage, seconds):
+        """记录一个阶段耗时（秒）"""
+        histogram = self._stages.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self._stages.setdefault(stage, metrics.RollingHistogram(self.window))
+        histogram.observe(max(seconds, 0.0))
+        if self.metric:
+            metrics.observe(self.metric, seconds, 'Video frame latency in seconds', stage=stage, **self.labels)
+
+    def fps(self):
+        """最近 window 秒的平均到达帧率"""
+        with self._lock:
+            if len(self._arrivals) < 2:
+                return 0.0
+            first, last = self._arrivals[0], self._arrivals[-1]
+            count = len(self._arrivals)
+        # 源已经停了就不再报告旧的帧率
+        if time.time() - last > self.window:
+            return 0.0
+        return (count - 1) / max(last - first, 1e-6)
+
+    def summary(self, quantiles=(0.5, 0.95, 0.99)):
+        """{'fps', 'window', 'stages': {阶段: {'count', 'p50', ...}}}，耗时单位为毫秒"""
+        stages = {}
+        for stage, histogram in list(self._stages.items()):
+            count, values = histogram.snapshot(quantiles)
+            if not count:
+                continue
+            stages[stage] = {'count': count}
+            for q, value in values.items():
+                stages[stage][f'p{q * 100:g}'] = round(value * 1000, 2)
+        return {'fps': round(self.fps(), 2), 'window': self.window, 'stages': stages}
+
+    def overlay_text(self, stages, separator='  '):
+        """叠加文字：帧率和指定阶段的 p50/p95 毫秒数，没有样本的阶段跳过"""
+        summary = self.summary(OVERLAY_QUANTILES)
+        parts = [f"{summary['fps']:.1f} fps"]
+        for stage in stages:
+            values = summary['stages'].get(stage)
+            if values:
+                parts.append(f"{stage} {values['p50']:.1f}/{values['p95']:.1f} ms")
+        return separator.join(parts)
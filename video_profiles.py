@@ -0,0 +1,165 @@
+import threading
+import time
+from collections import namedtuple
+
+# 参数范围限制，防止客户端请求异常的尺寸或质量
+MIN_WIDTH, MAX_WIDTH = 160, 3840
+MIN_QUALITY, MAX_QUALITY = 10, 95
+MAX_FPS = 60
+
+
+class VideoProfile(namedtuple('VideoProfile', 'width quality fps overlay')):
+    """视频配置：宽度、JPEG质量、帧率上限、是否叠加文字；None 表示保持原样"""
+
+    __slots__ = ()
+
+    def __new__(cls, width=None, quality=None, fps=None, overlay=False):
+        return super().__new__(cls, width, quality, fps, overlay)
+
+    @classmethod
+    def from_args(cls, args, default=None):
+        """从查询参数 w/q/fps 解析，非法值忽略；未指定的项沿用 default"""
+        default = default or cls()
+
+        def read(key, low, high):
+            try:
+                value = int(args.get(key))
+            except (TypeError, ValueError):
+                return None
+            return min(max(value, low), high)
+
+        width = read('w', MIN_WIDTH, MAX_WIDTH)
+        quality = read('q', MIN_QUALITY, MAX_QUALITY)
+        fps = read('fps', 1, MAX_FPS)
+        return cls(width or default.width, quality or default.quality, fps or default.fps, default.overlay)
+
+    @property
+    def encoding(self):
+        """决定编码结果的部分（帧率只影响发送节奏，不影响缓存）"""
+        return self._replace(fps=None)
+
+    @property
+    def needs_transform(self):
+        """是否真的需要解码：没有缩放、质量或叠加要求时直接转发原始JPEG"""
+        return bool(self.width or self.quality or self.overlay)
+
+
+# 写出阻塞时逐级降低的配置
+PROFILE_LADDER = (
+    VideoProfile(960, 70),
+    VideoProfile(640, 60),
+    VideoProfile(480, 50),
+    VideoProfile(320, 40),
+)
+
+
+def step_down(profile):
+    """返回比当前配置更低一档的配置，已是最低档时返回 None"""
+    for rung in PROFILE_LADDER:
+        if profile.width is None or rung.width < profile.width:
+            quality = min(rung.quality, profile.quality or rung.quality)
+            return profile._replace(width=rung.width, quality=quality)
+    return None
+
+
+class VariantCache:
+    """按配置缓存重新编码后的帧：同一源帧、同一配置只编码一次，所有该配置的客户端共享字节"""
+
+    def __init__(self, idle_ttl=30.0):
+        self.idle_ttl = idle_ttl
+        self._lock = threading.Lock()
+        self._variants = {}  # 编码配置 -> _Variant
+        self.encodes = 0
+        self.hits = 0
+
+    def get(self, seq, jpg, profile):
+        """返回源帧 seq 在该配置下的JPEG；不需要变换时直接返回原始字节"""
+        key = profile.encoding
+        if not key.needs_transform:
+            return jpg
+        # OpenCV 只在第一次需要重新编码时加载，直接转发原始JPEG的部署不会导入它
+        from frame_codec import transform_jpeg
+
+        now = time.monotonic()
+        with self._lock:
+            variant = self._variants.get(key)
+            if variant is None:
+                variant = self._variants[key] = _Variant()
+            variant.last_used = now
+            self._evict_idle(now)
+
+        # 每个配置一把锁：并发请求同一帧时只有一个线程编码，其余等待结果
+        with variant.lock:
+            encoded = variant.seq != seq
+            if encoded:
+                variant.data = transform_jpeg(jpg, key.width, key.quality, key.overlay)
+                variant.seq = seq
+            data = variant.data
+        # 计数器由所有配置共享，放在全局锁下更新
+        with self._lock:
+            if encoded:
+                self.encodes += 1
+            else:
+                self.hits += 1
+        return data
+
+    def profiles(self):
+        with self._lock:
+            return list(self._variants)
+
+    def _evict_idle(self, now):
+        for key in [key for key, variant in self._variants.items() if now - variant.last_used > self.idle_ttl]:
+            del self._variants[key]
+
+
+class _Variant:
+    __slots__ = ('lock', 'seq', 'data', 'last_used')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.seq = None
+        self.data = None
+        self.last_used = 0.0
+
+
+class AdaptiveProfile:
+    """根据写出耗时调整单个客户端的配置
+
+    生成器 yield 后到下一次被调用之间的时间近似为服务器把这一帧写入socket的耗时。
+    连续 slow_frames 帧写出耗时超过帧间隔的 slow_ratio 倍时降一档；
+    持续 recover_after 秒写出顺畅后回升一档，但不会超过客户端请求的配置。
+    """
+
+    def __init__(self, requested, frame_interval=1 / 15, slow_ratio=1.5, slow_frames=3, recover_after=10.0):
+        self.requested = requested
+        self.current = requested
+        self.frame_interval = frame_interval
+        self.slow_ratio = slow_ratio
+        self.slow_frames = slow_frames
+        self.recover_after = recover_after
+        self.history = []  # 被降档前的配置，回升时依次恢复
+        self._slow = 0
+        self._smooth_since = time.monotonic()
+
+    def record_write(self, seconds):
+        """记录一次写出耗时，配置发生变化时返回 True"""
+        now = time.monotonic()
+        interval = 1.0 / self.current.fps if self.current.fps else self.frame_interval
+        if seconds > interval * self.slow_ratio:
+            self._slow += 1
+            self._smooth_since = now
+            if self._slow >= self.slow_frames:
+                self._slow = 0
+                lower = step_down(self.current)
+                if lower is not None:
+                    self.history.append(self.current)
+                    self.current = lower
+                    return True
+            return False
+
+        self._slow = 0
+        if self.history and now - self._smooth_since >= self.recover_after:
+            self.current = self.history.pop()
+            self._smooth_since = now
+            return True
+        return False